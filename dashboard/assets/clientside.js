@@ -0,0 +1,129 @@
+/* Callbacks run in the browser, from the bundle in the 'client-data' store.
+ * They build the same figures as the Python callbacks of the same name in
+ * healthy-dash.py, which are used instead when HEALTHY_CLIENTSIDE=0.
+ * The packed arrays of the bundle are described in clientside.py. */
+
+function decode(text, Type) {
+    var bytes = atob(text);
+    var buffer = new Uint8Array(bytes.length);
+    for (var i = 0; i < bytes.length; i++) {
+        buffer[i] = bytes.charCodeAt(i);
+    }
+    return new Type(buffer.buffer);
+}
+
+/* Decoded datasets of the bundle version seen last */
+var decoded = {version: null, measures: {}};
+
+function dataset(data, measure) {
+    if (decoded.version !== data.version) {
+        decoded = {version: data.version, measures: {}};
+    }
+    if (!(measure in decoded.measures)) {
+        var packed = data.measures[measure];
+        var codes = decode(packed.country, Uint16Array);
+        var values = {};
+        var order = {};
+        Object.keys(packed.columns).forEach(function(column) {
+            values[column] = decode(packed.columns[column], Float32Array);
+            order[column] = decode(packed.order[column], Uint16Array);
+        });
+        decoded.measures[measure] = {
+            intake: packed.intake,
+            countries: Array.from(codes, function(code) { return data.countries[code]; }),
+            food: decode(packed.food, Float32Array),
+            values: values,
+            order: order
+        };
+    }
+    return decoded.measures[measure];
+}
+
+function barFigure(countries, values, column, title, template) {
+    return {
+        data: [{
+            type: 'bar',
+            x: countries,
+            y: values,
+            orientation: 'v',
+            marker: {color: '#636efa'},
+            hovertemplate: 'Country=%{x}<br>' + column + '=%{y}<extra></extra>',
+            name: '',
+            legendgroup: '',
+            showlegend: false,
+            alignmentgroup: 'True',
+            offsetgroup: '',
+            textposition: 'auto',
+            xaxis: 'x',
+            yaxis: 'y'
+        }],
+        layout: {
+            template: template,
+            xaxis: {anchor: 'y', domain: [0.0, 1.0], title: {text: 'Country'}},
+            yaxis: {anchor: 'x', domain: [0.0, 1.0], title: {text: column}},
+            legend: {tracegroupgap: 0},
+            title: {text: title},
+            barmode: 'relative'
+        }
+    };
+}
+
+var COVID_TITLES = {
+    Confirmed: 'Confirmed Cases - Percentage of total population',
+    Deaths: 'Number of Deaths - Percentage of total population',
+    Active: 'Active Cases - Percentage of total population',
+    Mortality: 'Mortality'
+};
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    healthy: {
+        update_covid: function(value, measure, data) {
+            var bundle = dataset(data, measure);
+            var start = value[0] - 1;
+            var end = value[1];
+
+            return Object.keys(COVID_TITLES).map(function(column) {
+                var order = Array.from(bundle.order[column].subarray(start, end));
+                var values = bundle.values[column];
+                return barFigure(
+                    order.map(function(i) { return bundle.countries[i]; }),
+                    order.map(function(i) { return values[i]; }),
+                    column, COVID_TITLES[column], data.template);
+            });
+        },
+
+        update_pie: function(value, measure, data) {
+            var bundle = dataset(data, measure);
+            var size = data.food_groups.length;
+            var start = bundle.countries.indexOf(value) * size;
+            var row = Array.from(bundle.food.subarray(start, start + size));
+
+            return {
+                data: [{
+                    type: 'pie',
+                    labels: data.food_groups,
+                    values: row,
+                    domain: {x: [0.0, 1.0], y: [0.0, 1.0]},
+                    hovertemplate: 'label=%{label}<br>value=%{value}<extra></extra>',
+                    name: '',
+                    legendgroup: '',
+                    showlegend: true,
+                    textinfo: 'percent+label',
+                    textposition: 'inside'
+                }],
+                layout: {
+                    template: data.template,
+                    legend: {tracegroupgap: 0},
+                    title: {text: bundle.intake + ' ' + value}
+                }
+            };
+        },
+
+        selected_text: function(click) {
+            if (!click) {
+                return 'Select a country by clicking on map.';
+            }
+            return click.points[0].hovertext + ' selected - info in red.';
+        }
+    }
+});
@@ -0,0 +1,390 @@
+"""Benchmarks of the app start up and of every callback.
+
+    python benchmark.py run [-o results.json] [--repeat N]
+    python benchmark.py load [-o results.json] [--workers N] [--threads N]
+                             [--requests N] [--concurrency N] [--url URL]
+    python benchmark.py compare BASELINE.json CURRENT.json [--threshold 0.25]
+
+``run`` times a cold import of healthy-dash.py in a fresh interpreter, the
+data preparation steps, then calls every callback function directly (Dash
+and the figure cache bypassed) over sweeps of realistic inputs, including
+JSON serialization of the outputs. ``load`` starts gunicorn on a local port
+(or uses ``--url``) and replays the same kind of requests through HTTP from
+concurrent clients. Both write a JSON file (``./cache/benchmark-*.json`` by
+default); ``compare`` reports every timing of CURRENT slower than BASELINE
+by more than the threshold and exits with status 1 if there is any.
+"""
+import argparse
+import importlib.util
+import inspect
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import plotly.utils
+
+import datasets
+import datastore
+from countries import load_iso_index
+from storage import cache_path, data_path
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'healthy-dash.py')
+## Figures reported for each benchmark, all in milliseconds
+STATS = ['median', 'mean', 'p95', 'min', 'max']
+
+
+def summarize(times):
+    ms = np.asarray(times) * 1000
+    return OrderedDict([
+        ('calls', len(ms)),
+        ('median', float(np.median(ms))),
+        ('mean', float(ms.mean())),
+        ('p95', float(np.percentile(ms, 95))),
+        ('min', float(ms.min())),
+        ('max', float(ms.max())),
+    ])
+
+
+def timed(func, args_list, repeat=1):
+    times = []
+    for _ in range(repeat):
+        for args in args_list:
+            start = time.perf_counter()
+            func(*args)
+            times.append(time.perf_counter() - start)
+    return summarize(times)
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location('healthy_dash', APP_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+###############################################################################
+################ SWEEPS #######################################################
+###############################################################################
+def slider_windows(n):
+    windows = []
+    for width in (5, 10, 25, 50, 100, n):
+        for start in range(1, n - width + 2, max(width, 20)):
+            windows.append([start, start + width - 1])
+    return windows
+
+
+def click(country):
+    return {'points': [{'hovertext': country}]}
+
+
+def sweeps(app):
+    """callback name -> (function, list of argument tuples)."""
+    from datastore import food_columns
+    import choropleth
+    import clusters
+    import countryindex
+    import significance
+
+    measures = list(datasets.DATASETS)
+    measure = datasets.DEFAULT_MEASURE
+    countries = datasets.supply(measure)['Country'].tolist()
+    selects = [countries[:size] for size in (1, 2, 5, 10, 20, 50, 100, len(countries))]
+
+    return OrderedDict([
+        ('update_covid', (app.update_covid,
+            [(window, m) for m in measures for window in slider_windows(len(countries))])),
+        ('update_table', (app.update_table,
+            [(selected, measure, 0, 10, sort_by, '')
+             for selected in selects
+             for sort_by in ([], [{'column_id': 'Deaths', 'direction': 'desc'}])])),
+        ('update_custom', (app.update_custom,
+            [(x, y, size, measure) for x in ('Confirmed', 'Obesity')
+             for y in ('Deaths', 'Active') for size in ('Active', 'Obesity')])),
+        ('update_histograms', (app.update_histograms,
+            [(left, 'Vegetal Products', nbins, m) for m in measures
+             for left in food_columns[:5] for nbins in (10, 30)])),
+        ('update_significance', (app.update_significance,
+            [(statistic, m) for m in measures for statistic in significance.STATISTICS])),
+        ('update_pie', (app.update_pie, [(c, measure) for c in countries])),
+        ('update_bar', (app.update_bar, [(c, measure) for c in countries[::5]])),
+        ('update_map', (app.update_map,
+            [(variable, m) for m in measures for variable in choropleth.VARIABLES])),
+        ('update_mapgraph', (app.update_mapgraph,
+            [(click(c), measure) for c in countries])),
+        ('update_clusters', (app.update_clusters,
+            [(method, k, 'Animal fats', 'Cereals - Excluding Beer', pair, measure)
+             for method in clusters.METHODS for k in (2, 4, 8) for pair in ([], ['pair'])])),
+        ('update_whatif', (app.update_whatif,
+            [(measure,) + tuple(countryindex.food_vector(c, measure)) for c in countries[::10]])),
+        ('update_similar', (app.update_similar,
+            [(c, k, measure) for c in countries[::5] for k in (5, 20)])),
+        ('test', (app.test, [(None,)] + [(click(c),) for c in countries[::10]])),
+    ])
+
+
+###############################################################################
+################ RUN ##########################################################
+###############################################################################
+def time_import(repeat=3):
+    """Cold import of the app module in fresh interpreters."""
+    code = ('import time, importlib.util; start = time.perf_counter(); '
+            'spec = importlib.util.spec_from_file_location("healthy_dash", %r); '
+            'spec.loader.exec_module(importlib.util.module_from_spec(spec)); '
+            'print(time.perf_counter() - start)' % APP_FILE)
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             cwd=os.path.dirname(APP_FILE))
+        times.append(float(out.stdout.decode().split()[-1]))
+    return summarize(times)
+
+
+def time_data(repeat=3):
+    paths = [data_path(d['file']) for d in datasets.DATASETS.values()]
+
+    def prepare(path):
+        df_full = pd.read_csv(path)
+        iso_codes = load_iso_index(path, df_full['Country'].tolist())
+        datastore.derive_frames(datastore.clean_supply(df_full, iso_codes))
+
+    return OrderedDict([
+        ('clean csv', timed(prepare, [(p,) for p in paths], repeat)),
+        ('load cached', timed(datastore.load_supply, [(p,) for p in paths], repeat)),
+    ])
+
+
+def run(repeat=1, import_repeat=3):
+    results = OrderedDict()
+    results['import'] = time_import(import_repeat)
+    for name, stats in time_data().items():
+        results['data: ' + name] = stats
+
+    app = load_app()
+    encode = plotly.utils.PlotlyJSONEncoder
+    with app.app.server.test_request_context():
+        for name, (callback, args_list) in sweeps(app).items():
+            func = inspect.unwrap(callback)
+
+            def call(*args):
+                # Serializing the outputs is part of answering a callback
+                json.dumps(func(*args), cls=encode)
+
+            call(*args_list[0])
+            results['callback: ' + name] = timed(call, args_list, repeat)
+    return results
+
+
+###############################################################################
+################ LOAD #########################################################
+###############################################################################
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers, port, threads=1):
+    process = subprocess.Popen(
+        ['gunicorn', '--workers', str(workers), '--threads', str(threads),
+         '--bind', '127.0.0.1:%d' % port,
+         'healthy-dash:server'],
+        cwd=os.path.dirname(APP_FILE),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:%d' % port
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited with status %d' % process.returncode)
+        try:
+            urllib.request.urlopen(url + '/_dash-layout', timeout=5).read()
+            return process, url
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start in time')
+
+
+def dash_request(outputs, inputs):
+    """Body of a /_dash-update-component request."""
+    out_specs = [{'id': i, 'property': p} for i, p in outputs]
+    if len(outputs) == 1:
+        output, out_specs = '%s.%s' % outputs[0], out_specs[0]
+    else:
+        output = '..' + '...'.join('%s.%s' % o for o in outputs) + '..'
+    return {
+        'output': output,
+        'outputs': out_specs,
+        'inputs': [{'id': i, 'property': p, 'value': v} for i, p, v in inputs],
+        'changedPropIds': ['%s.%s' % inputs[0][:2]],
+    }
+
+
+def load_requests():
+    """name -> list of request bodies, for the server side callbacks."""
+    import choropleth
+
+    countries = datasets.supply()['Country'].tolist()
+    measure = datasets.DEFAULT_MEASURE
+    table = [('dt-covid', 'columns'), ('dt-covid', 'data'), ('dt-covid', 'page_count')]
+    mapgraph = [('obesity', 'figure'), ('under', 'figure'), ('AP', 'figure')]
+    return OrderedDict([
+        ('update_table', [dash_request(table, [
+            ('covid-country-dd', 'value', countries[:size]), ('measure', 'value', measure),
+            ('dt-covid', 'page_current', 0), ('dt-covid', 'page_size', 10),
+            ('dt-covid', 'sort_by', []), ('dt-covid', 'filter_query', '')])
+            for size in (1, 5, 20, 100, len(countries))]),
+        ('update_map', [dash_request([('map', 'figure')], [
+            ('food-cat', 'value', variable), ('measure', 'value', m)])
+            for m in datasets.DATASETS for variable in choropleth.VARIABLES]),
+        ('update_mapgraph', [dash_request(mapgraph, [
+            ('map', 'clickData', click(c)), ('measure', 'value', measure)])
+            for c in countries[::5]]),
+    ])
+
+
+def post(url, body):
+    request = urllib.request.Request(
+        url + '/_dash-update-component', data=json.dumps(body).encode(),
+        headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def load(url=None, workers=2, requests=500, concurrency=8, threads=1):
+    datasets.load_all()
+    process = None
+    if url is None:
+        process, url = start_gunicorn(workers, free_port(), threads)
+    results = OrderedDict()
+    try:
+        for name, bodies in load_requests().items():
+            sequence = [bodies[i % len(bodies)] for i in range(requests)]
+            # Warm up every worker before timing
+            for body in bodies:
+                post(url, body)
+            with ThreadPoolExecutor(concurrency) as pool:
+                start = time.perf_counter()
+                times = list(pool.map(lambda body: post(url, body), sequence))
+                wall = time.perf_counter() - start
+            stats = summarize(times)
+            stats['requests_per_second'] = requests / wall
+            results['load: ' + name] = stats
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return results
+
+
+###############################################################################
+################ COMPARE ######################################################
+###############################################################################
+def regressions(baseline, current, threshold=0.25, stat='median'):
+    """Benchmarks whose ``stat`` grew by more than ``threshold``."""
+    slower = OrderedDict()
+    for name, stats in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None or not before[stat]:
+            continue
+        ratio = stats[stat] / before[stat]
+        if ratio > 1 + threshold:
+            slower[name] = (before[stat], stats[stat], ratio)
+    return slower
+
+
+def metadata(**settings):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                cwd=os.path.dirname(APP_FILE)).stdout.decode().strip()
+    except OSError:
+        commit = ''
+    return OrderedDict([
+        ('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ('commit', commit),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('cpus', os.cpu_count()),
+        ('settings', settings),
+    ])
+
+
+def report(results):
+    print('%-32s %6s ' % ('benchmark', 'calls') + ' '.join('%9s' % s for s in STATS) + '  (ms)')
+    for name, stats in results.items():
+        print('%-32s %6d ' % (name, stats['calls']) +
+              ' '.join('%9.3f' % stats[s] for s in STATS) +
+              ('  %.1f req/s' % stats['requests_per_second']
+               if 'requests_per_second' in stats else ''))
+
+
+def save(path, results, **settings):
+    path = path or cache_path('benchmark-%s.json' % time.strftime('%Y%m%d-%H%M%S'))
+    with open(path, 'w') as f:
+        json.dump({'meta': metadata(**settings), 'results': results}, f, indent=2)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the dashboard.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_parser = commands.add_parser('run', help='time start up and every callback')
+    run_parser.add_argument('-o', '--output')
+    run_parser.add_argument('--repeat', type=int, default=1)
+
+    load_parser = commands.add_parser('load', help='load test a local gunicorn server')
+    load_parser.add_argument('-o', '--output')
+    load_parser.add_argument('--url')
+    load_parser.add_argument('--workers', type=int, default=2)
+    load_parser.add_argument('--threads', type=int, default=1)
+    load_parser.add_argument('--requests', type=int, default=500)
+    load_parser.add_argument('--concurrency', type=int, default=8)
+
+    compare_parser = commands.add_parser('compare', help='check for regressions')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.25)
+    compare_parser.add_argument('--stat', choices=STATS, default='median')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        results = run(args.repeat)
+        report(results)
+        print(save(args.output, results, repeat=args.repeat))
+    elif args.command == 'load':
+        results = load(args.url, args.workers, args.requests, args.concurrency,
+                       args.threads)
+        report(results)
+        print(save(args.output, results, url=args.url, workers=args.workers,
+                   threads=args.threads,
+                   requests=args.requests, concurrency=args.concurrency))
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        slower = regressions(baseline, current, args.threshold, args.stat)
+        for name, (before, after, ratio) in slower.items():
+            print('%-32s %9.3f -> %9.3f ms  (x%.2f)' % (name, before, after, ratio))
+        if slower:
+            return 1
+        print('No regressions above %.0f%%' % (100 * args.threshold))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""World map coloured by one of a handful of variables.
+
+The geo layout, locations and hover names do not depend on the chosen
+variable, so the map is built once per dataset. Switching the variable
+only swaps the z vector and colour scale, both precomputed here.
+"""
+from collections import OrderedDict
+
+import plotly.express as px
+import plotly.graph_objs as go
+
+import datasets
+
+## Variables offered by the food-cat radio items and their colour scales
+VARIABLES = OrderedDict([
+    ('Deaths', 'balance'),
+    ('Confirmed', 'balance'),
+    ('Active', 'balance'),
+    ('Obesity', 'Reds'),
+    ('Undernourished', 'Reds'),
+    ('Animal Products', 'Armyrose'),
+    ('Vegetal Products', 'PRGn'),
+])
+
+## dataset version -> (base figure dict, {variable: z values})
+_base = datasets.register_cache({})
+_scales = {}
+
+
+def colorscale(name):
+    """Resolve a named colour scale to the list plotly.js expects."""
+    if name not in _scales:
+        scale = go.Layout(coloraxis=dict(colorscale=name)).coloraxis.colorscale
+        _scales[name] = [list(step) for step in scale]
+    return _scales[name]
+
+
+def base_figure(measure=datasets.DEFAULT_MEASURE):
+    key = datasets.version(measure)
+    if key not in _base:
+        df = datasets.supply(measure)
+        variable = next(iter(VARIABLES))
+        fig = px.choropleth(data_frame = df,
+                locations= "iso_alpha",
+                color= variable,
+                hover_name= "Country",
+                color_continuous_scale= VARIABLES[variable],
+                projection = 'natural earth')
+        z = {v: df[v].tolist() for v in VARIABLES}
+        _base[key] = (fig.to_plotly_json(), z)
+    return _base[key]
+
+
+def figure(value, measure=datasets.DEFAULT_MEASURE):
+    """Map figure dict coloured by ``value``."""
+    fig, z = base_figure(measure)
+    trace = dict(fig['data'][0], z = z[value],
+                 hovertemplate = '<b>%{hovertext}</b><br><br>iso_alpha=%{location}<br>'
+                                 + value + '=%{z}<extra></extra>')
+    layout = dict(fig['layout'],
+                  coloraxis = {'colorbar': {'title': {'text': value}},
+                               'colorscale': colorscale(VARIABLES[value])},
+                  title = {'text': value + " worlwide"})
+    return dict(fig, data=[trace], layout=layout)
+
+
+def build_all():
+    for measure in datasets.DATASETS:
+        base_figure(measure)
+    for name in VARIABLES.values():
+        colorscale(name)
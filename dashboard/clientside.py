@@ -0,0 +1,187 @@
+"""Data for the callbacks that run in the browser.
+
+Picking a slider window of the ranked COVID columns, the food group shares
+of one country or the name of a clicked country does not need the server:
+everything those callbacks read fits in a small bundle that is shipped once
+with the layout in a ``dcc.Store``, and the functions in
+``assets/clientside.js`` build the figures from it.
+
+The bundle is columnar: country names are sent once and each dataset refers
+to them by code, numeric columns are little-endian float32 arrays and rank
+orderings uint16 arrays, all base64 encoded. ``version`` is a hash of the
+data version; the browser decodes the arrays once per version.
+
+Set ``HEALTHY_CLIENTSIDE=0`` to register the Python callbacks instead.
+Run ``python clientside.py [measure ...]`` to export the packed cleaned
+tables to ``./cache`` and compare them with record-oriented JSON.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+import countryindex
+import datasets
+import ranks
+from datastore import food_groups
+from storage import cache_path, write_json
+
+ENABLED = os.environ.get('HEALTHY_CLIENTSIDE', '1') != '0'
+
+## Columns of the top-N bar charts driven by the slider
+RANKED = ['Confirmed', 'Deaths', 'Active', 'Mortality']
+
+## dataset version -> packed data of that dataset
+_bundles = datasets.register_cache({})
+
+
+def pack(values, dtype='<f4'):
+    """Base64 of ``values`` as a little-endian array of ``dtype``."""
+    return base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode('ascii')
+
+
+def unpack(text, dtype='<f4'):
+    return np.frombuffer(base64.b64decode(text), dtype=dtype)
+
+
+def country_codes(countries, categories):
+    codes = pd.Categorical(countries, categories=categories).codes
+    if (codes < 0).any():
+        raise KeyError('Countries missing from the categories')
+    return pack(codes, '<u2')
+
+
+def pack_frame(df, categories, columns=None):
+    """Columnar form of ``df``: country codes and float32 numeric columns."""
+    if columns is None:
+        columns = list(df.select_dtypes('number').columns)
+    return {
+        'length': len(df),
+        'country': country_codes(df['Country'], categories),
+        'columns': {col: pack(df[col].values) for col in columns},
+    }
+
+
+def unpack_frame(packed, categories):
+    countries = np.asarray(categories, dtype=object)[unpack(packed['country'], '<u2')]
+    df = pd.DataFrame({col: unpack(text) for col, text in packed['columns'].items()})
+    df.insert(0, 'Country', countries)
+    return df
+
+
+def categories():
+    """Country names of every dataset, in the order their codes refer to."""
+    names = set()
+    for measure in datasets.DATASETS:
+        names.update(datasets.supply(measure)['Country'])
+    return sorted(names)
+
+
+def build_bundle(measure, categories):
+    df = datasets.supply(measure)
+    order = ranks.ranks(measure)
+    packed = pack_frame(df, categories, RANKED)
+    packed['intake'] = datasets.info(measure)['intake']
+    # Row major, one row of food group shares per country
+    packed['food'] = pack(countryindex.index(measure)['food'])
+    packed['order'] = {col: pack(order[col], '<u2') for col in RANKED}
+    return packed
+
+
+def dataset_bundle(measure, categories):
+    version = datasets.version(measure)
+    if version not in _bundles:
+        _bundles[version] = build_bundle(measure, categories)
+    return _bundles[version]
+
+
+def version_hash():
+    return hashlib.sha1(datasets.data_version().encode()).hexdigest()[:16]
+
+
+def bundle():
+    """Everything the clientside callbacks need, for all the datasets."""
+    names = categories()
+    return {
+        'version': version_hash(),
+        'countries': names,
+        'food_groups': food_groups,
+        # Same look as the figures plotly.express builds on the server
+        'template': pio.templates[pio.templates.default].to_plotly_json(),
+        'measures': {measure: dataset_bundle(measure, names)
+                     for measure in datasets.DATASETS},
+    }
+
+
+def build_all():
+    names = categories()
+    for measure in datasets.DATASETS:
+        dataset_bundle(measure, names)
+
+
+class LazyBundle:
+    """Placeholder for the bundle in the layout, built on serialization."""
+
+    def to_plotly_json(self):
+        return bundle()
+
+
+###############################################################################
+################ EXPORT #######################################################
+###############################################################################
+def export(measures=(datasets.DEFAULT_MEASURE,)):
+    """Write the packed cleaned tables of ``measures`` to ``./cache``."""
+    names = categories()
+    tables = {
+        'version': version_hash(),
+        'countries': names,
+        'measures': {measure: pack_frame(datasets.supply(measure), names)
+                     for measure in measures},
+    }
+    path = cache_path('client-data-%s-%s.json' % (tables['version'], '-'.join(measures)))
+    write_json(path, tables)
+    return path, tables
+
+
+def _parse_time(parse, text, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse(text)
+    return (time.perf_counter() - start) / repeat
+
+
+def compare(tables):
+    """Size and parse time of the packed tables against records JSON."""
+    packed = json.dumps(tables)
+    records = json.dumps({measure: datasets.supply(measure).to_dict('records')
+                          for measure in tables['measures']})
+
+    def parse_packed(text):
+        obj = json.loads(text)
+        return [unpack_frame(p, obj['countries']) for p in obj['measures'].values()]
+
+    return {
+        name: {
+            'bytes': len(text),
+            'gzip_bytes': len(gzip.compress(text.encode())),
+            'parse_ms': 1000 * _parse_time(parse, text),
+        }
+        for name, text, parse in [('records', records, json.loads),
+                                  ('packed', packed, parse_packed)]
+    }
+
+
+if __name__ == '__main__':
+    datasets.load_all()
+    path, tables = export(sys.argv[1:] or [datasets.DEFAULT_MEASURE])
+    print(path)
+    for name, result in compare(tables).items():
+        print('%-8s %8d bytes %8d gzipped %8.2f ms parse' % (
+            name, result['bytes'], result['gzip_bytes'], result['parse_ms']))
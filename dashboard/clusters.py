@@ -0,0 +1,131 @@
+"""Clusters of countries by food intake.
+
+Countries are clustered on their food group shares (all of ``food_groups``
+or any subset of them, like the pair of features the notebook helper used)
+with k-means or agglomerative clustering from scikit-learn. Fitted models
+and labels are kept per (dataset version, method, features, k), so moving
+between options in the dashboard only fits each combination once.
+
+``sweep`` fits every k of a range and scores it with the silhouette
+coefficient. Set ``HEALTHY_CLUSTER_PROCESSES`` (or pass ``processes``) to
+run the fits of a sweep in a process pool.
+"""
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.express as px
+import plotly.graph_objs as go
+from sklearn.cluster import AgglomerativeClustering, KMeans
+from sklearn.metrics import silhouette_score
+
+import datasets
+from datastore import food_groups
+
+METHODS = OrderedDict([
+    ('kmeans', 'k-means'),
+    ('agglomerative', 'Agglomerative (Ward)'),
+])
+K_RANGE = range(2, 11)
+DEFAULT_K = 4
+PROCESSES = int(os.environ.get('HEALTHY_CLUSTER_PROCESSES', '0'))
+
+## (dataset version, method, features, k) -> {'model': ..., 'labels': ...}
+_fits = datasets.register_cache({}, lambda key: key[0])
+## (dataset version, method, features, ks) -> {k: silhouette score}
+_sweeps = datasets.register_cache({}, lambda key: key[0])
+
+
+def make_model(method, k):
+    if method == 'kmeans':
+        return KMeans(n_clusters=k, n_init=10, random_state=0)
+    if method == 'agglomerative':
+        return AgglomerativeClustering(n_clusters=k, linkage='ward')
+    raise ValueError('Unknown clustering method %r' % method)
+
+
+def fit_labels(X, method, k):
+    model = make_model(method, k)
+    labels = model.fit_predict(X)
+    return model, labels
+
+
+def _score(X, method, k):
+    # Runs in the pool workers, so it only gets the feature matrix
+    _, labels = fit_labels(X, method, k)
+    return silhouette_score(X, labels)
+
+
+def feature_key(features=None):
+    """``features`` as a tuple without repeats, all food groups by default."""
+    return tuple(dict.fromkeys(features or food_groups))
+
+
+def feature_matrix(features=None, measure=datasets.DEFAULT_MEASURE):
+    return datasets.supply(measure)[list(feature_key(features))].values
+
+
+def fit(method, k, features=None, measure=datasets.DEFAULT_MEASURE):
+    """Fitted model and label of every country, in frame order."""
+    features = feature_key(features)
+    key = (datasets.version(measure), method, features, k)
+    if key not in _fits:
+        model, labels = fit_labels(feature_matrix(features, measure), method, k)
+        _fits[key] = {'model': model, 'labels': labels}
+    return _fits[key]
+
+
+def labels(method, k, features=None, measure=datasets.DEFAULT_MEASURE):
+    return fit(method, k, features, measure)['labels']
+
+
+def sweep(method, ks=K_RANGE, features=None, measure=datasets.DEFAULT_MEASURE,
+          processes=None):
+    """Silhouette score of every k in ``ks``."""
+    features = feature_key(features)
+    ks = tuple(ks)
+    key = (datasets.version(measure), method, features, ks)
+    if key in _sweeps:
+        return _sweeps[key]
+
+    X = feature_matrix(features, measure)
+    processes = PROCESSES if processes is None else processes
+    if processes > 1:
+        with ProcessPoolExecutor(processes) as pool:
+            scores = list(pool.map(_score, [X] * len(ks), [method] * len(ks), ks))
+    else:
+        scores = []
+        for k in ks:
+            # Keep the fits, the panel shows the same k right after
+            scores.append(silhouette_score(X, labels(method, k, features, measure)))
+    _sweeps[key] = OrderedDict(zip(ks, scores))
+    return _sweeps[key]
+
+
+def figure(method, k, x, y, features=None, measure=datasets.DEFAULT_MEASURE):
+    """Countries on two food groups, colored by cluster."""
+    # x and y may be the same food group
+    df = datasets.supply(measure)[list(dict.fromkeys(['Country', x, y]))].copy()
+    df['Cluster'] = labels(method, k, features, measure).astype(str)
+    return px.scatter(df, x=x, y=y, color='Cluster', hover_name='Country',
+                      category_orders={'Cluster': [str(i) for i in range(k)]},
+                      template='simple_white',
+                      title='%s clusters, k = %d' % (METHODS[method], k))
+
+
+def sweep_figure(method, k, features=None, measure=datasets.DEFAULT_MEASURE):
+    scores = sweep(method, features=features, measure=measure)
+    fig = px.line(x=list(scores), y=list(scores.values()), template='simple_white',
+                  labels={'x': 'k', 'y': 'Silhouette score'},
+                  title='Silhouette score by number of clusters')
+    if k in scores:
+        fig.add_trace(go.Scatter(x=[k], y=[scores[k]], mode='markers',
+                                 marker=dict(color='crimson', size=12),
+                                 showlegend=False, hoverinfo='skip'))
+    return fig
+
+
+def build_all():
+    for measure in datasets.DATASETS:
+        for method in METHODS:
+            fit(method, DEFAULT_K, measure=measure)
@@ -0,0 +1,153 @@
+"""Request coalescing for bursty callbacks.
+
+Dragging the slider or typing in a country dropdown fires many requests
+with the same or quickly superseded inputs. Two things keep the work of a
+worker proportional to the distinct requests rather than to the events:
+
+* ``single_flight``: concurrent calls of a callback with the same inputs
+  (and data version) share one computation; the first caller runs it and
+  the others wait for its result.
+* debouncing, when ``HEALTHY_DEBOUNCE_MS`` is set: a call first waits that
+  long and gives up with ``PreventUpdate`` if a newer call of the same
+  callback arrived from the same browser session meanwhile.
+
+Both only apply within a worker, and need a threaded one
+(``gunicorn --threads N``) to see concurrent requests at all. Sessions are
+told apart by a cookie set by ``init_app``. Requests without it (the first
+one of a session) are never debounced: clients behind one proxy share an
+address, and would cancel each other's calls.
+
+Only server-side callbacks are coalesced. ``update_covid`` runs in the
+browser unless ``HEALTHY_CLIENTSIDE=0`` (see ``clientside``), so by default
+the slider requests never reach the server.
+"""
+import functools
+import os
+import threading
+import time
+import uuid
+
+import flask
+from dash.exceptions import PreventUpdate
+from prometheus_client import Counter
+
+import datasets
+from figcache import make_key
+
+DEBOUNCE = float(os.environ.get('HEALTHY_DEBOUNCE_MS', '0')) / 1000
+COOKIE = 'healthy_session'
+
+COALESCED = Counter(
+    'dash_callback_coalesced_total', 'Calls served by an identical call in flight',
+    ['callback'])
+DEBOUNCED = Counter(
+    'dash_callback_debounced_total', 'Calls dropped for a newer call of the same session',
+    ['callback'])
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time, sharing its result."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        """Return ``func(*args)`` and whether another caller computed it."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = func(*args)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+
+class Debouncer:
+    """Drop calls superseded by a newer one of the same session."""
+
+    def __init__(self):
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._tickets = 0
+
+    def wait(self, slot, delay):
+        """Sleep ``delay`` seconds and tell whether no newer call took ``slot``."""
+        with self._lock:
+            self._tickets += 1
+            ticket = self._latest[slot] = self._tickets
+        time.sleep(delay)
+        with self._lock:
+            if self._latest.get(slot) != ticket:
+                return False
+            del self._latest[slot]
+            return True
+
+
+_flights = SingleFlight()
+_debouncer = Debouncer()
+
+
+def session_key():
+    """Session cookie of the request, ``None`` without one."""
+    return flask.request.cookies.get(COOKIE)
+
+
+def single_flight(name=None, debounce=None):
+    """Decorator coalescing concurrent identical calls of a callback.
+
+    ``debounce`` (seconds) overrides ``HEALTHY_DEBOUNCE_MS`` for this
+    callback; 0 disables debouncing.
+    """
+    def decorator(func):
+        cb_name = name or func.__name__
+        delay = DEBOUNCE if debounce is None else debounce
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            session = session_key() if delay and flask.has_request_context() else None
+            if session is not None:
+                if not _debouncer.wait((session, cb_name), delay):
+                    DEBOUNCED.labels(cb_name).inc()
+                    raise PreventUpdate
+
+            key = make_key(cb_name, args, datasets.data_version())
+            result, shared = _flights.do(key, func, *args)
+            if shared:
+                COALESCED.labels(cb_name).inc()
+            return result
+        return wrapper
+    return decorator
+
+
+def _set_session(response):
+    if COOKIE not in flask.request.cookies:
+        response.set_cookie(COOKIE, uuid.uuid4().hex, httponly=True, samesite='Lax')
+    return response
+
+
+def init_app(app):
+    """Give every browser session a cookie, for debouncing."""
+    app.server.after_request(_set_session)
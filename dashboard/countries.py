@@ -0,0 +1,75 @@
+"""Country name -> ISO 3166 alpha-3 resolution.
+
+Resolving names with ``pycountry.countries.search_fuzzy`` takes seconds, so
+the mapping is resolved once per data file and cached on disk. Names that
+pycountry can't match at all live in ``data/iso_overrides.csv``.
+"""
+import os
+
+import pandas as pd
+
+from storage import cache_path, data_path, file_digest, read_json, write_json
+
+OVERRIDES_FILE = data_path('iso_overrides.csv')
+
+## ISO code used for countries we could not resolve
+UNKNOWN = ' '
+
+
+def load_overrides(path=OVERRIDES_FILE):
+    df = pd.read_csv(path)
+    return dict(zip(df['Country'], df['iso_alpha']))
+
+
+def _exact_names():
+    import pycountry
+
+    names = {}
+    for country in pycountry.countries:
+        for attr in ('name', 'official_name', 'common_name'):
+            name = getattr(country, attr, None)
+            if name:
+                names[name.casefold()] = country.alpha_3
+    return names
+
+
+def resolve_countries(countries, overrides):
+    """Resolve each name in ``countries`` to its alpha-3 code.
+
+    Overrides win, then exact (case insensitive) matches against pycountry
+    names; the fuzzy search only runs for whatever is left.
+    """
+    import pycountry
+
+    exact = _exact_names()
+    codes = {}
+    for country in countries:
+        if country in overrides:
+            codes[country] = overrides[country]
+        elif country.casefold() in exact:
+            codes[country] = exact[country.casefold()]
+        else:
+            try:
+                # The first item of the list is the best fit
+                codes[country] = pycountry.countries.search_fuzzy(country)[0].alpha_3
+            except LookupError:
+                codes[country] = UNKNOWN
+    return codes
+
+
+def load_iso_index(csv_path, countries):
+    """Country -> ISO code mapping for ``csv_path``, cached on disk.
+
+    The cache entry is keyed on the contents of the data file and the
+    overrides file, so editing either one triggers a rebuild.
+    """
+    key = file_digest(csv_path, OVERRIDES_FILE)
+    path = cache_path('iso-%s-%s.json' % (os.path.basename(csv_path), key))
+    if os.path.exists(path):
+        codes = read_json(path)
+        if set(codes) >= set(countries):
+            return codes
+
+    codes = resolve_countries(countries, load_overrides())
+    write_json(path, codes)
+    return codes
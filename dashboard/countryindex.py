@@ -0,0 +1,67 @@
+"""Per-country row lookups.
+
+Selecting a country used to mean a boolean scan of the whole frame
+(``df.Country == value`` or ``isin``). This keeps, for each dataset, a dict
+from country name to row position together with the food group matrix and
+the COVID table records, so a lookup is a dict access and a multi-country
+selection is one batched pass over the requested names.
+"""
+import datasets
+from datastore import food_groups
+
+## dataset version -> index dict (see build_index)
+_indexes = datasets.register_cache({})
+
+
+def build_index(frames):
+    df = frames['df']
+    return {
+        'position': {country: i for i, country in enumerate(df['Country'])},
+        'food': df[food_groups].values,
+        'covid_columns': list(frames['df_covid'].columns),
+        'covid_records': frames['df_covid'].to_dict('records'),
+    }
+
+
+def index(measure=datasets.DEFAULT_MEASURE):
+    version = datasets.version(measure)
+    if version not in _indexes:
+        _indexes[version] = build_index(datasets.frames(measure))
+    return _indexes[version]
+
+
+def build_all():
+    for measure in datasets.DATASETS:
+        index(measure)
+
+
+def positions(countries, measure=datasets.DEFAULT_MEASURE):
+    """Row positions of ``countries`` in frame order, unknown names dropped.
+
+    This is the order ``df[df.Country.isin(countries)]`` would give.
+    """
+    position = index(measure)['position']
+    return sorted({position[c] for c in countries if c in position})
+
+
+def row(country, measure=datasets.DEFAULT_MEASURE, columns=None):
+    """Single row frame of ``country``, like ``df[df.Country == country]``."""
+    df = datasets.supply(measure)
+    pos = positions([country], measure)
+    return df.iloc[pos] if columns is None else df[columns].iloc[pos]
+
+
+def food_vector(country, measure=datasets.DEFAULT_MEASURE):
+    """Shares of each of the food groups for ``country``."""
+    idx = index(measure)
+    return idx['food'][idx['position'][country]]
+
+
+def covid_columns(measure=datasets.DEFAULT_MEASURE):
+    return index(measure)['covid_columns']
+
+
+def covid_records(countries, measure=datasets.DEFAULT_MEASURE):
+    """COVID table records of ``countries``, in frame order."""
+    records = index(measure)['covid_records']
+    return [records[pos] for pos in positions(countries, measure)]
@@ -0,0 +1,278 @@
+"""Registry of the four supply datasets served by the dashboard.
+
+All four files are loaded once per process (from the datastore cache) and
+looked up by a short "measure" key, which is what the ``measure`` selector
+in the app sends to the callbacks. The latest COVID-19 snapshot ingested by
+``timeseries.py``, if any, replaces the COVID columns of the files.
+
+Everything loaded lives in an immutable ``Snapshot``. A watcher thread
+(see ``start_watcher``) rebuilds it when the data files change and
+publishes the new one by swapping a single reference; caches registered
+with ``register_cache`` drop the entries of versions no longer served.
+Within a Flask request, every read sees the snapshot that was current when
+the request first asked for data.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import flask
+
+import startup
+import timeseries
+from countries import OVERRIDES_FILE
+from datastore import derive_frames, load_supply
+from storage import data_path
+
+DATASETS = OrderedDict([
+    ('kg', {'file': 'Food_Supply_Quantity_kg_Data.csv',
+            'label': 'Food quantity (kg)',
+            'intake': 'Food intake (in kg)',
+            'unit': 'kg'}),
+    ('kcal', {'file': 'Food_Supply_kcal_Data.csv',
+              'label': 'Energy (kcal)',
+              'intake': 'Energy intake (in kcal)',
+              'unit': 'kcal'}),
+    ('fat', {'file': 'Fat_Supply_Quantity_Data.csv',
+             'label': 'Fat',
+             'intake': 'Fat intake',
+             'unit': 'fat'}),
+    ('protein', {'file': 'Protein_Supply_Quantity_Data.csv',
+                 'label': 'Protein',
+                 'intake': 'Protein intake',
+                 'unit': 'protein'}),
+])
+
+DEFAULT_MEASURE = 'kg'
+
+## Seconds between two checks of the data files, 0 disables the watcher
+RELOAD_SECONDS = float(os.environ.get('HEALTHY_RELOAD_SECONDS', 30))
+
+_current = None
+## Stats of source_files() when they were last checked
+_sources = None
+_lock = threading.Lock()
+_caches = []
+_watcher_pid = None
+
+
+def source_files():
+    """Files whose changes trigger a reload."""
+    paths = [data_path(info['file']) for info in DATASETS.values()]
+    paths.append(OVERRIDES_FILE)
+    paths.append(timeseries.STORE_FILE)
+    return paths
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def apply_covid(frames, covid):
+    """Frames with the COVID columns replaced by the ``covid`` snapshot.
+
+    Returns the new frames and the columns whose values changed; only the
+    columns depending on the COVID counts are recomputed.
+    """
+    df = frames['df'].copy()
+    rows = df['Country'].isin(covid.index)
+    for col in timeseries.COLUMNS:
+        df.loc[rows, col] = df.loc[rows, 'Country'].map(covid[col]).values
+    changed = list(timeseries.COLUMNS)
+
+    df['Mortality'] = df['Deaths']/df['Confirmed']
+    changed.append('Mortality')
+
+    # Only depends on Obesity, but keep it right if the mean ever shifts
+    above = (df["Obesity"] > df['Obesity'].mean()).astype(int)
+    if not above.equals(df['ObesityAboveAvg']):
+        df['ObesityAboveAvg'] = above
+        changed.append('ObesityAboveAvg')
+
+    return derive_frames(df), changed
+
+
+class Snapshot:
+    """All the data served at one point in time. Never modified."""
+
+    def __init__(self, serial, base, previous=None):
+        self.serial = serial
+        self.base = base
+        self.covid_version = timeseries.store_version()
+        covid = timeseries.latest() if self.covid_version else None
+
+        self.versions = {}
+        self.frames = {}
+        ## version -> (parent version, changed columns), see changed_since
+        self.changed = {}
+        for measure, (version, frames) in base.items():
+            if covid is not None:
+                frames, changed = apply_covid(frames, covid)
+                parent = version
+                version = version + '+covid-' + self.covid_version
+                if previous is not None and previous.base[measure][0] == parent:
+                    # Same diet data, dependent indexes only rebuild the
+                    # columns that changed
+                    self.changed[version] = (previous.versions[measure], changed)
+            self.versions[measure] = version
+            self.frames[measure] = frames
+
+        ## One key covering the versions of every dataset
+        self.key = '|'.join(self.versions[measure] for measure in DATASETS)
+
+
+def _load_base():
+    base = {}
+    for measure, info in DATASETS.items():
+        with startup.phase(measure):
+            base[measure] = load_supply(data_path(info['file']))
+    return base
+
+
+def load_all():
+    global _current, _sources
+
+    if _current is not None:
+        return
+    with _lock:
+        if _current is not None:
+            return
+        _sources = {path: _stat(path) for path in source_files()}
+        _current = Snapshot(1, _load_base())
+
+
+def register_cache(cache, version_of=lambda key: key):
+    """Have stale entries of the dict ``cache`` dropped on reloads.
+
+    Entries of the current and the previous snapshot are kept. ``version_of``
+    extracts the dataset version from a key of ``cache``.
+    Objects with a ``clear`` method but no dict interface are cleared.
+    """
+    _caches.append((cache, version_of))
+    return cache
+
+
+def _prune_caches(*snapshots):
+    live = set()
+    for snapshot in snapshots:
+        live |= set(snapshot.versions.values()) | {snapshot.key}
+    for cache, version_of in _caches:
+        if not isinstance(cache, dict):
+            cache.clear()
+            continue
+        for key in list(cache):
+            if version_of(key) not in live:
+                cache.pop(key, None)
+
+
+def reload():
+    """Rebuild the snapshot if a data file changed since the current one.
+
+    Returns True when a new snapshot was published. Requests already being
+    served keep the snapshot they started with.
+    """
+    global _current, _sources
+
+    load_all()
+    sources = {path: _stat(path) for path in source_files()}
+    if sources == _sources:
+        return False
+
+    with _lock:
+        if sources == _sources:
+            return False
+        previous = _current
+        snapshot = Snapshot(previous.serial + 1, _load_base(), previous)
+        _sources = sources
+        if snapshot.key == previous.key:
+            # Files touched but their contents did not change
+            return False
+        _current = snapshot
+    # Requests still running on the previous snapshot keep their entries,
+    # and incremental rebuilds can start from them
+    _prune_caches(snapshot, previous)
+    return True
+
+
+def _watch(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            reload()
+        except Exception:
+            # Half written files and the like, try again on the next tick
+            logging.getLogger(__name__).exception('data reload failed')
+
+
+def start_watcher(interval=RELOAD_SECONDS):
+    """Start the reload thread of this process, once.
+
+    Safe to call on every request: threads do not survive a fork, so under
+    ``gunicorn --preload`` each worker starts its own on its first request.
+    """
+    global _watcher_pid
+
+    if interval <= 0 or _watcher_pid == os.getpid():
+        return
+    with _lock:
+        if _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+        threading.Thread(target=_watch, args=(interval,), name='data-watcher',
+                         daemon=True).start()
+
+
+def current():
+    """Snapshot to read from, pinned for the duration of a Flask request."""
+    load_all()
+    if flask.has_request_context():
+        if 'data_snapshot' not in flask.g:
+            flask.g.data_snapshot = _current
+        return flask.g.data_snapshot
+    return _current
+
+
+def _measure(measure):
+    return measure if measure in DATASETS else DEFAULT_MEASURE
+
+
+def base_frames(measure=DEFAULT_MEASURE):
+    """Frames as built from the CSV, without ingested COVID data."""
+    return current().base[_measure(measure)][1]
+
+
+def frames(measure=DEFAULT_MEASURE):
+    return current().frames[_measure(measure)]
+
+
+def supply(measure=DEFAULT_MEASURE):
+    """Cleaned frame of one dataset, same layout as the original ``kg_df``."""
+    return frames(measure)['df']
+
+
+def version(measure=DEFAULT_MEASURE):
+    return current().versions[_measure(measure)]
+
+
+def changed_since(version):
+    """``(parent version, changed columns)`` if ``version`` came from a reload."""
+    return current().changed.get(version)
+
+
+def data_version():
+    """One key covering the versions of every loaded dataset."""
+    return current().key
+
+
+def info(measure):
+    return DATASETS.get(measure, DATASETS[DEFAULT_MEASURE])
+
+
+def measure_options():
+    return [{'label': d['label'] + '  ', 'value': m} for m, d in DATASETS.items()]
@@ -0,0 +1,152 @@
+"""Cleaned, pre-built copies of the supply data files.
+
+Parsing and cleaning the CSVs is done once by a build step that writes the
+resulting frames as uncompressed Feather files under ``./cache``. Workers
+then only open and memory map those files: the numeric columns are
+read-only NumPy views over the mapped Arrow buffers, so every worker reads
+the same page cache pages instead of holding its own copy. Only the string
+columns (``Country``, ``iso_alpha``) become private Python objects, and a
+COVID overlay (``datasets.apply_covid``) works on a copy. Every build
+lives in its own directory keyed on a hash of the source files, so editing
+a CSV or the ISO overrides simply makes the old build unreachable.
+
+Run ``python datastore.py`` before starting the server to pre-build the
+cache for every dataset; otherwise the first worker to boot builds it.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+import pyarrow.feather as feather
+
+import startup
+from countries import OVERRIDES_FILE, load_iso_index
+from storage import CACHE_DIR, cache_path, data_path, file_digest
+
+## Bump when the cleaning below changes, so stale builds are not reused
+BUILD_VERSION = 3
+
+FRAMES = ('df', 'df_covid', 'df_high_ob', 'df_low_ob')
+
+## Features
+food_groups = ['Alcoholic Beverages', 'Animal fats',
+       'Aquatic Products, Other', 'Cereals - Excluding Beer', 'Eggs',
+       'Fish, Seafood', 'Fruits - Excluding Wine', 'Meat',
+       'Milk - Excluding Butter', 'Miscellaneous', 'Offals', 'Oilcrops',
+       'Pulses', 'Spices', 'Starchy Roots', 'Stimulants', 'Sugar & Sweeteners',
+       'Sugar Crops', 'Treenuts', 'Vegetable Oils', 'Vegetables']
+
+## Food columns rescaled to percentages (food groups plus the two totals)
+food_columns = food_groups + ['Animal Products', 'Vegetal Products']
+
+
+def clean_supply(df_full, iso_codes):
+    # Let's drop the last column as it is just a unit information
+    df = df_full.drop('Unit (all except Population)', axis = 1)
+
+    ## Taking care of Undernourished non numeric entries
+    df.loc[df_full['Undernourished'] == '<2.5', 'Undernourished'] = '2.0'
+    df['Undernourished'] = pd.to_numeric(df['Undernourished'])
+
+    ## Rescaling food columns to sum to 100%
+    df[food_columns] = df[food_columns] * 2
+
+    ## Fill missing values with mean
+    df = df.fillna(df.mean(numeric_only=True))
+
+    ## Create 'Mortality' column
+    df['Mortality'] = df['Deaths']/df['Confirmed']
+
+    ## Create 'ObesityAboveAvg' column
+    df['ObesityAboveAvg'] = (df["Obesity"] > df['Obesity'].mean()).astype(int)
+
+    ## ISO 3 code of each country, used by the maps
+    df['iso_alpha'] = df['Country'].map(iso_codes)
+
+    return df
+
+
+def derive_frames(df):
+    return {
+        'df': df,
+        ## DF with COVID info
+        'df_covid': df[['Country','Confirmed','Deaths','Active','Mortality']],
+        ## HOC and LOC df
+        'df_high_ob': df[df.Obesity > df['Obesity'].mean()],
+        'df_low_ob': df[df.Obesity <= df['Obesity'].mean()],
+    }
+
+
+def source_version(csv_path):
+    return '%s-v%d-%s' % (os.path.splitext(os.path.basename(csv_path))[0],
+                          BUILD_VERSION, file_digest(csv_path, OVERRIDES_FILE))
+
+
+def _write_frames(frames, directory):
+    for name, df in frames.items():
+        # The row labels are kept in the pandas metadata of the file
+        feather.write_feather(df, os.path.join(directory, name + '.feather'),
+                              compression='uncompressed')
+
+
+def _read_frame(path):
+    # One block per column: the numeric ones are views of the mapped file,
+    # not copies. Nothing may modify the frame in place.
+    return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+
+
+def build(csv_path, force=False):
+    """Clean ``csv_path`` and write its frames to the cache.
+
+    Returns the build directory. Nothing is done if it already exists,
+    unless ``force`` is set.
+    """
+    version = source_version(csv_path)
+    target = cache_path(version)
+    if os.path.isdir(target) and not force:
+        return target
+
+    with startup.phase('read csv'):
+        df_full = pd.read_csv(csv_path)
+    with startup.phase('iso codes'):
+        iso_codes = load_iso_index(csv_path, df_full['Country'].tolist())
+    with startup.phase('clean'):
+        df = clean_supply(df_full, iso_codes)
+
+    # Write next to the target and rename it in place, another worker
+    # may be building the same version at the same time
+    tmp = tempfile.mkdtemp(dir=CACHE_DIR, prefix='.tmp-')
+    try:
+        with startup.phase('write'):
+            _write_frames(derive_frames(df), tmp)
+        if force and os.path.isdir(target):
+            shutil.rmtree(target)
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            # Someone else finished first, their build is just as good
+            pass
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def load_supply(csv_path):
+    """Return ``(version, frames)`` for ``csv_path``, building it if needed."""
+    directory = build(csv_path)
+    with startup.phase('read feather'):
+        frames = {name: _read_frame(os.path.join(directory, name + '.feather'))
+                  for name in FRAMES}
+    return os.path.basename(directory), frames
+
+
+if __name__ == '__main__':
+    force = '--force' in sys.argv
+    paths = [p for p in sys.argv[1:] if p != '--force']
+    if not paths:
+        from datasets import DATASETS
+        paths = [data_path(d['file']) for d in DATASETS.values()]
+    for path in paths:
+        print(build(path, force=force))
@@ -0,0 +1,190 @@
+"""Static report pages of every country.
+
+    python export.py [-o DIR] [--measure kg [--measure kcal ...]]
+                     [--processes N] [--force] [country ...]
+
+For each country and dataset this writes ``DIR/<measure>/<country>.html``,
+a standalone page with the food intake pie, the animal/vegetal bar chart,
+the highlighted feature bars and the COVID table row, and ``<country>.json``
+with the same figures as plotly JSON. ``plotly.min.js`` is written once per
+directory, so the pages work offline.
+
+Countries are rendered in a process pool; each worker loads the cached
+frames once (memory mapped, so the workers share them) and then renders
+any number of countries. A manifest keeps a digest of the inputs of every
+page, and pages whose inputs did not change are skipped unless
+``--force`` is given.
+"""
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.io as pio
+import plotly.offline
+import plotly.utils
+
+import countryindex
+import datasets
+import highlight
+import reports
+from storage import read_json, write_atomic, write_json
+
+## Bump when the pages change, to render them all again
+EXPORT_VERSION = 1
+DIRECTORY = os.environ.get('HEALTHY_EXPORT_DIR', './export')
+MANIFEST = 'manifest.json'
+
+PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="plotly.min.js"></script>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; }}
+th, td {{ border: 1px solid black; padding: 4px 8px; }}
+th {{ background-color: rgb(0, 153, 92); color: white; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p>{intake}</p>
+{covid}
+{figures}
+</body>
+</html>
+'''
+
+
+def slug(country):
+    return re.sub(r'[^A-Za-z0-9]+', '-', country).strip('-')
+
+
+def digests(measure, countries):
+    """Digest of the inputs of the page of each of ``countries``."""
+    df = datasets.supply(measure)
+    # The highlighted bars show every country
+    shared = hashlib.sha1(repr((EXPORT_VERSION, measure, datasets.info(measure))).encode())
+    shared.update(df[['Country'] + highlight.FEATURES].to_json().encode())
+    position = countryindex.index(measure)['position']
+    result = {}
+    for country in countries:
+        h = shared.copy()
+        h.update(df.iloc[position[country]].to_json().encode())
+        result[country] = h.hexdigest()[:16]
+    return result
+
+
+def covid_table(record):
+    cells = ''.join('<tr><th>{}</th><td>{}</td></tr>'.format(
+        html.escape(str(k)), html.escape(str(v))) for k, v in record.items())
+    return '<table>%s</table>' % cells
+
+
+def render(country, measure):
+    """Figures and HTML page of ``country``."""
+    figures = [reports.food_pie(country, measure), reports.animal_vegetal_bar(country, measure)]
+    figures += reports.highlight_bars(country, measure)
+    record = reports.covid_record(country, measure)
+    page = PAGE.format(
+        title=html.escape(country),
+        intake=html.escape(datasets.info(measure)['intake']),
+        covid=covid_table(record),
+        figures='\n'.join(pio.to_html(fig, full_html=False, include_plotlyjs=False)
+                          for fig in figures))
+    bundle = json.dumps({'country': country, 'measure': measure, 'covid': record,
+                         'figures': figures}, cls=plotly.utils.PlotlyJSONEncoder)
+    return page, bundle
+
+
+def _write_text(path, text):
+    def write(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+    write_atomic(path, write)
+
+
+def _init_worker():
+    # Each worker maps the cached frames once for all its countries
+    datasets.load_all()
+
+
+def export_country(country, measure, directory):
+    start = time.perf_counter()
+    page, bundle = render(country, measure)
+    name = slug(country)
+    _write_text(os.path.join(directory, name + '.html'), page)
+    _write_text(os.path.join(directory, name + '.json'), bundle)
+    return country, time.perf_counter() - start
+
+
+def export(measure, countries=None, directory=DIRECTORY, processes=None, force=False):
+    """Render the pages of ``countries`` (all by default) that changed.
+
+    Returns the number of pages rendered and skipped.
+    """
+    directory = os.path.join(directory, measure)
+    os.makedirs(directory, exist_ok=True)
+    plotly_js = os.path.join(directory, 'plotly.min.js')
+    if not os.path.exists(plotly_js):
+        _write_text(plotly_js, plotly.offline.get_plotlyjs())
+
+    countries = countries or datasets.supply(measure)['Country'].tolist()
+    manifest_path = os.path.join(directory, MANIFEST)
+    manifest = read_json(manifest_path) if os.path.exists(manifest_path) else {}
+    current = digests(measure, countries)
+    todo = [c for c in countries
+            if force or manifest.get(c) != current[c]
+            or not os.path.exists(os.path.join(directory, slug(c) + '.html'))]
+
+    if todo:
+        # Record the pages as they are written, so an interrupted run
+        # does not render them again
+        try:
+            with ProcessPoolExecutor(processes, initializer=_init_worker) as pool:
+                done = pool.map(export_country, todo, [measure] * len(todo),
+                                [directory] * len(todo), chunksize=8)
+                for country, _ in done:
+                    manifest[country] = current[country]
+        finally:
+            write_json(manifest_path, manifest)
+    return len(todo), len(countries) - len(todo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Static report pages of every country.')
+    parser.add_argument('countries', nargs='*')
+    parser.add_argument('-o', '--output', default=DIRECTORY)
+    parser.add_argument('--measure', action='append', choices=list(datasets.DATASETS))
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args(argv)
+
+    datasets.load_all()
+    measures = args.measure or [datasets.DEFAULT_MEASURE]
+    for measure in measures:
+        unknown = set(args.countries) - set(datasets.supply(measure)['Country'])
+        if unknown:
+            parser.error('unknown countries in the %s dataset: %s' % (
+                measure, ', '.join(sorted(unknown))))
+
+    for measure in measures:
+        start = time.perf_counter()
+        rendered, skipped = export(measure, args.countries, args.output,
+                                   args.processes, args.force)
+        elapsed = time.perf_counter() - start
+        print('%s: %d rendered, %d unchanged in %.1f s (%.1f pages/s)' % (
+            os.path.join(args.output, measure), rendered, skipped, elapsed,
+            rendered / elapsed if rendered else 0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
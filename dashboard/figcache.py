@@ -0,0 +1,163 @@
+"""Memoized callback results.
+
+The data behind the dashboard is static and the callback inputs are small
+and discrete (radio values, countries, slider ranges), so the figures they
+return are cached as serialized JSON, keyed on the callback name, its
+inputs and the version of the loaded data. A hit never touches pandas or
+plotly.
+
+The in-memory cache is a bounded LRU. Setting ``HEALTHY_FIGURE_CACHE_DIR``
+adds an on-disk layer that is shared by every worker on the machine. It
+keeps at most ``HEALTHY_FIGURE_CACHE_FILES`` files; past that the least
+recently used ones are deleted, which also drops the files of older data
+versions.
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.utils
+
+import datasets
+from storage import write_atomic
+
+MAXSIZE = int(os.environ.get('HEALTHY_FIGURE_CACHE_SIZE', 256))
+DIRECTORY = os.environ.get('HEALTHY_FIGURE_CACHE_DIR')
+MAXFILES = int(os.environ.get('HEALTHY_FIGURE_CACHE_FILES', 4096))
+
+
+def make_key(name, args, version=''):
+    return json.dumps([name, version, args], sort_keys=True, default=str)
+
+
+class FigureCache:
+
+    def __init__(self, maxsize=MAXSIZE, directory=DIRECTORY, version=datasets.data_version,
+                 maxfiles=MAXFILES):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.maxfiles = maxfiles
+        self.version = version
+        self.hits = {}
+        self.misses = {}
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._files = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._files = len(os.listdir(directory))
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if self.directory:
+            path = self._path(key)
+            try:
+                with open(path) as f:
+                    text = f.read()
+                # The modification time orders the files for pruning
+                os.utime(path)
+            except OSError:
+                return None
+            self._store(key, text)
+            return text
+        return None
+
+    def _store(self, key, text):
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def put(self, key, text):
+        self._store(key, text)
+        if self.directory:
+            def write(tmp):
+                with open(tmp, 'w') as f:
+                    f.write(text)
+            write_atomic(self._path(key), write)
+            with self._lock:
+                self._files += 1
+                full = self._files > self.maxfiles
+            if full:
+                self.prune()
+
+    def prune(self):
+        """Delete the least recently used files, down to 3/4 of ``maxfiles``.
+
+        The count of files is an estimate between prunes, since other
+        workers write to the same directory.
+        """
+        paths = []
+        for entry in os.scandir(self.directory):
+            try:
+                paths.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                pass
+        paths.sort()
+        excess = len(paths) - self.maxfiles * 3 // 4
+        for _, path in paths[:max(excess, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._files = len(paths) - max(excess, 0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _count(self, counter, name):
+        with self._lock:
+            counter[name] = counter.get(name, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'evictions': self.evictions,
+                'hits': dict(self.hits),
+                'misses': dict(self.misses),
+            }
+
+    def cached(self, name=None, normalize=None):
+        """Decorator caching the return value of a callback.
+
+        ``normalize`` maps the callback arguments to the part of them that
+        matters for the result, e.g. the country name out of a map click.
+        """
+        def decorator(func):
+            cb_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args):
+                key_args = normalize(*args) if normalize else args
+                key = make_key(cb_name, key_args, self.version())
+                text = self.get(key)
+                if text is not None:
+                    self._count(self.hits, cb_name)
+                    return json.loads(text)
+
+                self._count(self.misses, cb_name)
+                result = func(*args)
+                self.put(key, json.dumps(result, cls=plotly.utils.PlotlyJSONEncoder))
+                return result
+            return wrapper
+        return decorator
+
+
+## Cache shared by all callbacks of the app, emptied when the data reloads
+figure_cache = datasets.register_cache(FigureCache())
@@ -1,13 +1,36 @@
-import dash
-import dash_table
-import dash_core_components as dcc
-import dash_html_components as html
-from dash.dependencies import Output, Input
-import dash_bootstrap_components as dbc
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objs as go
-import pycountry
+import startup
+
+with startup.phase('import dash'):
+    import dash
+    import dash_table
+    import dash_core_components as dcc
+    import dash_html_components as html
+    from dash.dependencies import ClientsideFunction, Output, Input
+    import dash_bootstrap_components as dbc
+
+with startup.phase('import plotly'):
+    import plotly.express as px
+
+with startup.phase('import app modules'):
+    import choropleth
+    import clientside
+    import clusters
+    import coalesce
+    import countryindex
+    import datasets
+    import highlight
+    import histograms
+    import metrics
+    import models
+    import neighbours
+    import ranks
+    import reports
+    import significance
+    import static_figures
+    import tables
+    import trendlines
+    from figcache import figure_cache
+    from datastore import food_columns, food_groups
 
 ### Uncomment bellow to download data using kaggle API ###
 #######################################################
@@ -23,90 +46,83 @@ import pycountry
 # zf.close()
 #######################################################
 
-kg_df_full = pd.read_csv('./data/Food_Supply_Quantity_kg_Data.csv')
+## Cleaned data for the four supply datasets, built once by datastore.py
+## and cached in ./cache. The kg dataset is the default one.
+with startup.phase('data'):
+    datasets.load_all()
 
-# Cleaning data
+## Row position of every country, for the per-country callbacks
+with startup.phase('country index'):
+    countryindex.build_all()
 
-# Let's drop the last column as it is just a unit information
-kg_df = kg_df_full.drop('Unit (all except Population)', axis = 1)
+## Rank orderings of every numeric column, used by the top-N bar charts
+with startup.phase('ranks'):
+    ranks.build_all()
 
-## Taking care of Undernourished non numeric entries
-kg_df.loc[kg_df_full['Undernourished'] == '<2.5', 'Undernourished'] = '2.0'
-kg_df['Undernourished'] = pd.to_numeric(kg_df['Undernourished'])
+## OLS fits for every pair of scatter plot axes
+with startup.phase('trendlines'):
+    trendlines.build_all()
 
-## Rescaling food columns to sum to 100%
-kg_df.iloc[:,1:24] = kg_df.iloc[:, 1:24] * 2
+## Sorted bar charts highlighted on map clicks, of the default dataset only;
+## the others are built on their first click
+with startup.phase('highlight'):
+    highlight.build_all([datasets.DEFAULT_MEASURE])
 
-## Fill missing values with mean
-kg_df = kg_df.fillna(kg_df.mean())
+## World map, built once per dataset
+with startup.phase('choropleth'):
+    choropleth.build_all()
 
-## Create 'Mortality' column
-kg_df['Mortality'] = kg_df['Deaths']/kg_df['Confirmed']
+## Clusters of countries by food intake, default k of each method
+with startup.phase('clusters'):
+    clusters.build_all()
 
-## Create 'ObesityAboveAvg' column
-kg_df['ObesityAboveAvg'] = (kg_df["Obesity"] > kg_df['Obesity'].mean()).astype(int)
+## HOC/LOC classifier and Obesity/Mortality regressors, trained at build time
+with startup.phase('models'):
+    models.build_all()
 
-## DF with COVID info
-df_covid = kg_df[['Country','Confirmed','Deaths','Active','Mortality']]
+## Pairwise diet similarities, for the similar diets table
+with startup.phase('neighbours'):
+    neighbours.build_all()
 
-## HOC and LOC df
-df_high_ob = kg_df[kg_df.Obesity > kg_df['Obesity'].mean()]
-df_low_ob = kg_df[kg_df.Obesity <= kg_df['Obesity'].mean()]
+## Data of the callbacks that run in the browser
+if clientside.ENABLED:
+    with startup.phase('clientside'):
+        clientside.build_all()
 
-## Preparing countries dict for dropdown options
+## Preparing countries dict for dropdown options. Callbacks read the data
+## from datasets.current(), only this list is fixed for the process.
 countries_options = []
-for country in kg_df['Country']:
+for country in datasets.supply()['Country']:
     my_dict = {}
     my_dict['label'] = str(country)
     my_dict['value'] = str(country)
     countries_options.append(my_dict)
 
-## Features
-food_groups = ['Alcoholic Beverages', 'Animal fats',
-       'Aquatic Products, Other', 'Cereals - Excluding Beer', 'Eggs',
-       'Fish, Seafood', 'Fruits - Excluding Wine', 'Meat',
-       'Milk - Excluding Butter', 'Miscellaneous', 'Offals', 'Oilcrops',
-       'Pulses', 'Spices', 'Starchy Roots', 'Stimulants', 'Sugar & Sweeteners',
-       'Sugar Crops', 'Treenuts', 'Vegetable Oils', 'Vegetables']
-
-## colors for bar graph
-colors = ['IndianRed','DarkSeaGreen']
-
-## Getting country ISO numbers
-list_countries = kg_df['Country'].tolist()
-d_country_code = {}  # To hold the country names and their ISO
-for country in list_countries:
-    try:
-        country_data = pycountry.countries.search_fuzzy(country)
-        # country_data is a list of objects of class pycountry.db.Country
-        # The first item  ie at index 0 of list is best fit
-        # object of class Country have an alpha_3 attribute
-        country_code = country_data[0].alpha_3
-        d_country_code.update({country: country_code})
-    except:
-        # print('could not add ISO 3 code for ->', country)
-        # If could not find country, make ISO code ' '
-        d_country_code.update({country: ' '})
-
-d_country_code['Iran (Islamic Republic of)'] = 'IRN'
-d_country_code['Korea, North'] = 'PRK'
-d_country_code['Korea, South'] = 'KOR'
-d_country_code['Taiwan*'] = 'TWN'
-d_country_code['Venezuela (Bolivarian Republic of)'] = 'VEN'
-# print(d_country_code) # Uncomment to check dictionary
-
-# create a new column iso_alpha in the df
-# and fill it with appropriate iso 3 code
-for k, v in d_country_code.items():
-    kg_df.loc[(kg_df.Country == k), 'iso_alpha'] = v
-
 
 ###############################################################################
 ################ START OF APP #################################################
 ###############################################################################
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.MINTY])
+startup.begin('layout')
+## gzip responses with Flask-Compress, the layout carries the client data
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.MINTY], compress=True)
+## For gunicorn: gunicorn healthy-dash:server
+server = app.server
+
+## Callback latency and payload size metrics on /metrics
+metrics.init_app(app)
+
+## Session cookie for debouncing bursts of slider and dropdown requests
+coalesce.init_app(app)
+
+## Reload the data files when they change, without restarting workers
+@app.server.before_request
+def start_data_watcher():
+    datasets.start_watcher()
 
 app.layout = html.Div([
+    ## Shipped once with the layout, read by assets/clientside.js
+    dcc.Store(id='client-data',
+        data = clientside.LazyBundle() if clientside.ENABLED else None),
 
     dbc.Card([
         dbc.CardImg(src="https://images.squarespace-cdn.com/content/v1/5919b0fd6b8f5b6a4a256b4e/1580488750529-30TFT9JN7P0XR5ZS4H8Y/ke17ZwdGBToddI8pDm48kH-KoR6KuuBcq9Z5xi422Q8UqsxRUqqbr1mOJYKfIPR7LoDQ9mXPOjoJoqy81S2I8N_N4V1vUb5AoIIIbLZhVYy7Mythp_T-mtop-vrsUOmeInPi9iDjx9w8K4ZfjXt2dsEF-sCd5QWO5hm7HfmdIziW4p77bAKWYf1JE4Sw1bIUW07ycm2Trb21kYhaLJjddA/1.31.20-Highlight.jpg",
@@ -138,6 +154,19 @@ app.layout = html.Div([
     inverse=True),
 
     html.Br(),
+
+    dbc.Alert([
+        dbc.Row([
+            dbc.Col([html.Label('Choose the supply data used by the graphs:'),
+            dcc.RadioItems(id='measure',
+                options = datasets.measure_options(),
+                value = datasets.DEFAULT_MEASURE,
+                labelStyle={'display': 'inline-block'},
+                inputStyle={"margin-left": "20px"})
+            ])
+        ]),
+    ], color = 'light'),
+
     html.Br(),
 ############### COVID-19 distributions on countries
     dbc.Alert([
@@ -203,8 +232,15 @@ app.layout = html.Div([
         dbc.Col(dash_table.DataTable(
             id = 'dt-covid',
             editable = True,
-            data = df_covid[df_covid.Country.isin(['Brazil'])].to_dict('records'),
-            page_size = len(df_covid[df_covid.Country.isin(['Brazil'])].index),
+            # Paging, sorting and filtering run on the server, see tables.py
+            page_action = 'custom',
+            page_current = 0,
+            page_size = tables.PAGE_SIZE,
+            sort_action = 'custom',
+            sort_mode = 'single',
+            sort_by = [],
+            filter_action = 'custom',
+            filter_query = '',
             style_header={
                 'backgroundColor': 'rgb(0, 153, 92)',
                 'fontWeight': 'bold',
@@ -223,28 +259,12 @@ app.layout = html.Div([
 
     dbc.Row([
         dbc.Col(dcc.Graph(id='deaths-v-conf',
-            figure = (px.scatter(kg_df, x="Confirmed", y = "Deaths",size = "Active", hover_name='Country',
-                 size_max=30, trendline = "ols", template="simple_white",
-                 title='Deaths vs. Confirmed - Size corresponds to Active cases')) ),
+            figure = static_figures.lazy('deaths-v-conf')),
             width = {"size":5, "offset": 1}
             ),
 
         dbc.Col(dcc.Graph(id='ob-v-deaths',
-            figure = (px.scatter(kg_df, x="Deaths", y = "Obesity", size = "Mortality",
-                hover_name='Country', log_x=False, size_max=30, template="simple_white",
-                title='Obesity rate vs. Deaths - Size corresponds to Mortality'))
-                .add_shape(
-                        type="line",
-                        x0=0,
-                        y0=kg_df['Obesity'].mean(),
-                        x1=kg_df['Deaths'].max(),
-                        y1=kg_df['Obesity'].mean(),
-                        line=dict(
-                            color="crimson",
-                            width=4
-                        )
-                    )
-                ),
+            figure = static_figures.lazy('ob-v-deaths')),
             width = {"size":5, "offset": 1}
             )
     ]),
@@ -315,6 +335,7 @@ app.layout = html.Div([
             * Color scale refers to countries with Obesity rate above (1) or bellow (0) average.
             * The `count` value is measured in percentage of total food intake.
             * Vertical lines correspond to median value for each group.
+            * Choose the food groups bellow; the dataset is the one selected at the top of the page.
 
             '''))
         ]),
@@ -322,72 +343,72 @@ app.layout = html.Div([
 
 
     dbc.Row([
-        dbc.Col(dcc.Graph(id='animal-products',
-            figure = (px.histogram(kg_df, x = "Animal Products", nbins=50,
-                      color = "ObesityAboveAvg") )
-                      .add_shape(
-                              # Mean value of Vegetal Products intake in low obesity countries
-                                  type="line",
-                                  x0=df_low_ob['Animal Products'].median(),
-                                  y0=0,
-                                  x1=df_low_ob['Animal Products'].median(),
-                                  y1=12,
-                                  line=dict(
-                                      color="darkblue",
-                                      width=4
-                                  ),
-                          )
-                    .add_shape(
-                                # Mean value of Animal Products intake in high obesity countries
-                                    type="line",
-                                    x0=df_high_ob['Animal Products'].median(),
-                                    y0=0,
-                                    x1=df_high_ob['Animal Products'].median(),
-                                    y1=12,
-                                    line=dict(
-                                        color="crimson",
-                                        width=4
-                                    ),
-                            )
-                ),
+        dbc.Col([html.Label('Choose the food groups and the number of bins:'),
+            dbc.Row([
+                dbc.Col(dcc.Dropdown(id='hist-left',
+                    options = [{'label': f, 'value': f} for f in food_columns],
+                    value = 'Animal Products',
+                    clearable = False,
+                    style={'color': '#000000'})),
+                dbc.Col(dcc.Dropdown(id='hist-right',
+                    options = [{'label': f, 'value': f} for f in food_columns],
+                    value = 'Vegetal Products',
+                    clearable = False,
+                    style={'color': '#000000'})),
+                dbc.Col(dcc.Slider(id='hist-nbins',
+                    min = 10,
+                    max = 100,
+                    step = 10,
+                    marks = {i:str(i) for i in range(10, 101, 10)},
+                    value = 50))
+            ])
+        ], width = {"size":10, "offset":1})
+    ]),
 
+    dbc.Row([
+        dbc.Col(dcc.Graph(id='animal-products'),
             width = {"size":6}
             ),
 
-        dbc.Col(dcc.Graph(id='vegetal-products',
-            figure = (px.histogram(kg_df, x = "Vegetal Products", nbins=50,
-                      color = "ObesityAboveAvg") )
-                      .add_shape(
-                              # Mean value of Vegetal Products intake in low obesity countries
-                                  type="line",
-                                  x0=df_low_ob['Vegetal Products'].median(),
-                                  y0=0,
-                                  x1=df_low_ob['Vegetal Products'].median(),
-                                  y1=12,
-                                  line=dict(
-                                      color="darkblue",
-                                      width=4
-                                  ),
-                          )
-                    .add_shape(
-                                # Mean value of Animal Products intake in high obesity countries
-                                    type="line",
-                                    x0=df_high_ob['Vegetal Products'].median(),
-                                    y0=0,
-                                    x1=df_high_ob['Vegetal Products'].median(),
-                                    y1=12,
-                                    line=dict(
-                                        color="crimson",
-                                        width=4
-                                    ),
-                            )
-
-                ),
+        dbc.Col(dcc.Graph(id='vegetal-products'),
             width = {"size":6}
             )
     ]),
     html.Br(),
 
+    dbc.Row([
+        dbc.Col([
+            dcc.Markdown('''
+            #### Are the differences significant?
+
+            Difference between high and low obesity countries for every food
+            group, with its 95% bootstrap confidence interval and the p-value
+            of a permutation test.
+            '''),
+            dcc.RadioItems(id='significance-stat',
+                options=[{'label': stat.capitalize() + '  ', 'value': stat}
+                         for stat in significance.STATISTICS],
+                value = 'median',
+                labelStyle={'display': 'inline-block'},
+                inputStyle={"margin-left": "20px"}),
+            dash_table.DataTable(
+                id = 'dt-significance',
+                columns = [{"name": i, "id": i, "type": "text" if i == "Food group" else "numeric"}
+                           for i in significance.COLUMNS],
+                sort_action = 'native',
+                sort_by = [{'column_id': 'p-value', 'direction': 'asc'}],
+                style_header={
+                    'backgroundColor': 'rgb(0, 153, 92)',
+                    'fontWeight': 'bold',
+                    'color': 'white',
+                    'border': '1px solid black'
+                },
+                style_data={ 'border': '1px solid black' },
+                )
+        ], width = {"size":8, "offset": 2})
+    ]),
+    html.Br(),
+
     dbc.Alert([
         dbc.Row([
             dbc.Col(dcc.Markdown('''
@@ -402,8 +423,7 @@ app.layout = html.Div([
 
     dbc.Row([
         dbc.Col(dcc.Graph(id='death-obesity',
-            figure = (px.bar(kg_df, x = "Country", y ="Deaths", facet_col = "ObesityAboveAvg"))
-            .update_xaxes(matches=None,categoryorder="total descending")
+            figure = static_figures.lazy('death-obesity')
             ))
     ]),
     html.Br(),
@@ -479,6 +499,151 @@ app.layout = html.Div([
         dbc.Col(dcc.Graph(id='AP'), width = {"size":8, "offset": 2})
     ]),
 
+    html.Br(),
+    html.Hr(),
+################## CLUSTERS
+    dbc.Alert([
+        dbc.Row([
+            dbc.Col(dcc.Markdown('''
+            ## Clusters of countries by food intake
+
+            Countries are grouped by their share of every food group.
+            Choose the clustering method and the number of clusters, and the
+            two food groups to plot. The silhouette score helps choosing `k`.
+            '''
+            ))
+        ]),
+    ]),
+
+    dbc.Row([
+        dbc.Col([html.Label('Clustering method:'),
+            dcc.RadioItems(id='cluster-method',
+                options=[{'label': label + '  ', 'value': method}
+                         for method, label in clusters.METHODS.items()],
+                value = 'kmeans',
+                labelStyle={'display': 'inline-block'},
+                inputStyle={"margin-left": "20px"}),
+
+            html.Br(),
+
+            html.Label('Number of clusters:'),
+            dcc.Slider(id='cluster-k',
+                min = min(clusters.K_RANGE),
+                max = max(clusters.K_RANGE),
+                step = 1,
+                value = clusters.DEFAULT_K,
+                marks = {k: str(k) for k in clusters.K_RANGE}),
+
+            html.Label('Food groups to plot:'),
+            dcc.Dropdown(id='cluster-x',
+                options = [{'label': i, 'value': i} for i in food_groups],
+                value = 'Animal fats',
+                clearable = False),
+            dcc.Dropdown(id='cluster-y',
+                options = [{'label': i, 'value': i} for i in food_groups],
+                value = 'Cereals - Excluding Beer',
+                clearable = False),
+
+            html.Br(),
+
+            dcc.Checklist(id='cluster-pair',
+                options = [{'label': ' Cluster on the two plotted food groups only',
+                            'value': 'pair'}],
+                value = [])
+        ],width={"size":3,"offset":1}),
+
+        dbc.Col(dcc.Graph(id='cluster-graph'), width={"size":5}),
+
+        dbc.Col(dcc.Graph(id='cluster-sweep'), width={"size":3})
+    ]),
+
+    html.Br(),
+    html.Hr(),
+################## WHAT IF
+    dbc.Alert([
+        dbc.Row([
+            dbc.Col(dcc.Markdown('''
+            ## What if a country ate differently?
+
+            Start from the food intake of a country and change the share of
+            any food group. Linear models of the notebook, trained on every
+            country, predict whether it would be a high obesity country (HOC)
+            and its `Obesity` and `Mortality`. Each prediction comes with the
+            cross validated score of its model; a regressor that does no
+            better than the mean (R² ≤ 0) is not shown.
+            '''
+            )),
+
+            dbc.Col(dcc.Dropdown(id='whatif-country',
+                options = countries_options,
+                style={'color': '#000000'},
+                value = 'Brazil',
+                clearable = False
+                ), width = {"size":3})
+        ]),
+    ]),
+
+    dbc.Row([
+        dbc.Col([
+            html.Div([html.Label(group),
+                dcc.Slider(id='whatif-%d' % i, min = 0, max = 80, step = 0.1,
+                    value = 0, tooltip = {'placement': 'bottom'})])
+            for i, group in enumerate(food_groups) if i % 3 == col
+            ], width = {"size":3, "offset": 1 if col == 0 else 0})
+        for col in range(3)
+    ] + [
+        dbc.Col(dbc.Alert(id='whatif-result', color = "info"), width = {"size":2})
+    ]),
+
+    html.Br(),
+    html.Hr(),
+################## SIMILAR DIETS
+    dbc.Alert([
+        dbc.Row([
+            dbc.Col(dcc.Markdown('''
+            ## Countries with similar diets
+
+            Countries whose share of every food group is closest (cosine
+            similarity) to the chosen country, with their obesity and COVID-19
+            figures.
+            '''
+            )),
+
+            dbc.Col([
+                dcc.Dropdown(id='similar-country',
+                    options = countries_options,
+                    style={'color': '#000000'},
+                    value = 'Brazil',
+                    clearable = False),
+                html.Label('Number of countries:'),
+                dcc.Slider(id='similar-k',
+                    min = 1,
+                    max = 20,
+                    step = 1,
+                    value = neighbours.DEFAULT_K,
+                    marks = {i: str(i) for i in (1, 5, 10, 15, 20)})
+            ], width = {"size":3})
+        ]),
+    ]),
+
+    dbc.Row([
+        dbc.Col(dash_table.DataTable(
+            id = 'dt-similar',
+            columns = [{"name": i, "id": i, "type": "text" if i == "Country" else "numeric"}
+                       for i in ['Country', 'Similarity'] + neighbours.OUTCOMES],
+            sort_action = 'native',
+            style_header={
+                'backgroundColor': 'rgb(0, 153, 92)',
+                'fontWeight': 'bold',
+                'color': 'white',
+                'border': '1px solid black'
+            },
+            style_data={ 'border': '1px solid black' },
+            ),
+            width = {"size":8, "offset": 2}
+        )
+    ]),
+
 ###### WHITE SPACE
     html.Br(),
     html.Br(),
@@ -523,181 +688,268 @@ app.layout = html.Div([
 ])
 
 
+startup.end()
+
+
 #########################################
 ###################### CALLBACK FUNCTIONS
 #########################################
-@app.callback(
-    Output('confirmed','figure'),
-    Output('deaths','figure'),
-    Output('active','figure'),
-    Output('mortality','figure'),
-    [Input('slider','value')]
-)
-def update_covid(value):
+covid_outputs = [Output('confirmed','figure'),
+                 Output('deaths','figure'),
+                 Output('active','figure'),
+                 Output('mortality','figure')]
+covid_inputs = [Input('slider','value'),
+                Input('measure','value')]
+
+@metrics.instrumented()
+@coalesce.single_flight()
+@figure_cache.cached()
+def update_covid(value, measure):
     start = value[0]
     end = value[1]
 
-    fig1 = px.bar(kg_df.sort_values('Confirmed', ascending = False)[start-1:end],
+    fig1 = px.bar(ranks.top_window('Confirmed', start, end, measure),
                     x = "Country", y ="Confirmed",
                     title="Confirmed Cases - Percentage of total population")
 
-    fig2 = px.bar(kg_df.sort_values('Deaths', ascending = False)[start-1:end],
+    fig2 = px.bar(ranks.top_window('Deaths', start, end, measure),
                     x = "Country", y ="Deaths",
                     title="Number of Deaths - Percentage of total population")
 
-    fig3 = px.bar(kg_df.sort_values('Active', ascending = False)[start-1:end],
+    fig3 = px.bar(ranks.top_window('Active', start, end, measure),
                     x = "Country", y ="Active",
                     title="Active Cases - Percentage of total population")
 
-    fig4 = px.bar(kg_df.sort_values('Mortality', ascending = False)[start-1:end],
+    fig4 = px.bar(ranks.top_window('Mortality', start, end, measure),
                     x = "Country", y ="Mortality",
                     title="Mortality")
 
     return fig1,fig2,fig3,fig4
 
+if clientside.ENABLED:
+    app.clientside_callback(ClientsideFunction('healthy', 'update_covid'),
+        *covid_outputs, covid_inputs + [Input('client-data', 'data')])
+else:
+    app.callback(*covid_outputs, covid_inputs)(update_covid)
+
 
 @app.callback(
     Output('dt-covid', 'columns'),
     Output('dt-covid', 'data'),
-    Output('dt-covid', 'page_size'),
-    [Input('covid-country-dd', 'value')]
+    Output('dt-covid', 'page_count'),
+    [Input('covid-country-dd', 'value'),
+     Input('measure','value'),
+     Input('dt-covid', 'page_current'),
+     Input('dt-covid', 'page_size'),
+     Input('dt-covid', 'sort_by'),
+     Input('dt-covid', 'filter_query')]
 )
-def update_table(value):
+@metrics.instrumented()
+@coalesce.single_flight()
+def update_table(value, measure, page_current, page_size, sort_by, filter_query):
     selected = list(value)
     columns=[
-        {"name": i + "(% of population)", "id": i}
+        {"name": i + "(% of population)", "id": i, "type": "numeric"}
         if (i != "Country" and i != "Mortality") else
-        {"name": i, "id": i}
-        for i in df_covid[df_covid.Country.isin(selected)].columns
+        {"name": i, "id": i, "type": "text" if i == "Country" else "numeric"}
+        for i in countryindex.covid_columns(measure)
         ]
 
-    data = df_covid[df_covid.Country.isin(selected)].to_dict('records')
+    # Only the rows of the visible page are sent
+    data, page_count = tables.query_page(selected, page_current, page_size,
+                                         sort_by, filter_query, measure)
 
-    page_size = len(df_covid[df_covid.Country.isin(selected)].index)
-
-    return columns, data, page_size
+    return columns, data, page_count
 
 @app.callback(
     Output('custom-graph','figure'),
     [Input('x-axis','value'),
      Input('y-axis','value'),
-     Input('points-size','value')]
+     Input('points-size','value'),
+     Input('measure','value')]
 )
-def update_custom(xaxis, yaxis, psize):
+@metrics.instrumented()
+@figure_cache.cached()
+def update_custom(xaxis, yaxis, psize, measure):
+    kg_df = datasets.supply(measure)
     if psize != 'Obesity':
-        fig = px.scatter(kg_df, x=xaxis, y = yaxis, size = psize, hover_name='Country',
-                     size_max=30, trendline = "ols", template="simple_white")
+        fig = trendlines.scatter_ols(kg_df, x=xaxis, y = yaxis, measure = measure, size = psize,
+                     hover_name='Country', size_max=30, template="simple_white")
     else:
-        fig = px.scatter(kg_df, x=xaxis, y = yaxis, size = psize, hover_name='Country',
-                     trendline = "ols", template="simple_white")
+        fig = trendlines.scatter_ols(kg_df, x=xaxis, y = yaxis, measure = measure, size = psize,
+                     hover_name='Country', template="simple_white")
 
     return fig
 
 
 @app.callback(
-    Output('food-pie','figure'),
-    [Input('food-country-dd', 'value')]
+    Output('animal-products','figure'),
+    Output('vegetal-products','figure'),
+    [Input('hist-left','value'),
+     Input('hist-right','value'),
+     Input('hist-nbins','value'),
+     Input('measure','value')]
 )
-def update_pie(value):
+@metrics.instrumented()
+@figure_cache.cached()
+def update_histograms(left, right, nbins, measure):
+    # Bins are computed on the server, only the bar heights are sent
+    return (histograms.figure(left, nbins, measure),
+            histograms.figure(right, nbins, measure))
 
-    fig = px.pie(values = kg_df[food_groups][kg_df.Country == value].values.tolist()[0], names = food_groups,
-             title='Food intake (in kg) ' + value)
-    fig.update_traces(textposition='inside', textinfo='percent+label')
 
-    return fig
+@app.callback(
+    Output('dt-significance', 'data'),
+    [Input('significance-stat', 'value'),
+     Input('measure','value')]
+)
+@metrics.instrumented()
+def update_significance(statistic, measure):
+    # Resampling runs once per dataset version, see significance.py
+    return significance.records(statistic, measure)
+
+
+pie_inputs = [Input('food-country-dd', 'value'),
+              Input('measure','value')]
+
+@metrics.instrumented()
+@figure_cache.cached()
+def update_pie(value, measure):
+    return reports.food_pie(value, measure)
+
+if clientside.ENABLED:
+    app.clientside_callback(ClientsideFunction('healthy', 'update_pie'),
+        Output('food-pie','figure'), pie_inputs + [Input('client-data', 'data')])
+else:
+    app.callback(Output('food-pie','figure'), pie_inputs)(update_pie)
 
 @app.callback(
     Output('veg-v-animal', 'figure'),
-    [Input('food-country-dd', 'value')]
+    [Input('food-country-dd', 'value'),
+     Input('measure','value')]
 )
-def update_bar(value):
-    fig = px.bar(kg_df[['Country','Animal Products', 'Vegetal Products']][kg_df.Country == value],
-        x = 'Country', y = ['Animal Products', 'Vegetal Products'],
-        barmode = 'group',
-        color_discrete_sequence = colors,
-        title ='% of Animal and Vegetal products intake (kg) <br> - '+value)
-
-    return fig
+@metrics.instrumented()
+@figure_cache.cached()
+def update_bar(value, measure):
+    return reports.animal_vegetal_bar(value, measure)
 
 @app.callback(
     Output('map','figure'),
-    [Input('food-cat', 'value')]
+    [Input('food-cat', 'value'),
+     Input('measure','value')]
 )
-def update_map(value):
-    c_scale={
-        'Deaths': 'balance',
-        'Confirmed': 'balance',
-        'Active': 'balance',
-        'Obesity': 'Reds',
-        'Undernourished': 'Reds',
-        'Animal Products': 'Armyrose',
-        'Vegetal Products': 'PRGn'
-    }
-    fig = px.choropleth(data_frame = kg_df,
-            locations= "iso_alpha",
-            color= value,
-            hover_name= "Country",
-            color_continuous_scale= c_scale[value],
-            projection = 'natural earth',
-            title = value +" worlwide"
-            )
-    return fig
+@metrics.instrumented()
+@figure_cache.cached()
+def update_map(value, measure):
+    # Only the z values and color scale change between variables
+    return choropleth.figure(value, measure)
 
 @app.callback(
     Output('obesity','figure'),
     Output('under','figure'),
     Output('AP','figure'),
-    [Input('map', 'clickData')]
+    [Input('map', 'clickData'),
+     Input('measure','value')]
 )
-def update_mapgraph(click):
+@metrics.instrumented()
+@figure_cache.cached(normalize=lambda click, measure:
+    (click and click['points'][0]['hovertext'], measure))
+def update_mapgraph(click, measure):
     # Eliminate error when map not clicked!
     if click == None:
         return {},{},{}
 
-    # List of features to output
-    feat_list = ['Obesity', 'Undernourished', 'Animal Products']
-
     # Get name of clicked country
     country = click['points'][0]['hovertext']
 
-    # List of return values
-    R = []
+    # Swap the colors of the pre-sorted bar charts of each feature
+    return reports.highlight_bars(country, measure)
 
-    # Loop over g_list to create 4 bar plots
-    for feat in feat_list:
-        if feat == 'Obesity' or feat == 'Undernourished':
-            TITLE = feat +" rate - Percentage of total population"
-        else:
-            TITLE = "% of " + feat + " intake (kg)"
-        df1 = kg_df.sort_values(feat, ascending = False)
 
-        ind = df1.index[df1.Country == country].tolist()
 
-        colors = ['#ff0000' if i in ind else '#00cc44'
-                  for i in range(len(df1))]
 
-        fig1 = px.bar(kg_df,
-                        x = "Country", y =feat,
-                        title = TITLE)
-        fig1.update_traces(marker_color = colors)
-        fig1.update_xaxes(categoryorder="total descending")
+@metrics.instrumented()
+def test(click):
+    if click == None:
+        return 'Select a country by clicking on map.'
+    else:
+        return click['points'][0]['hovertext'] + ' selected - info in red.'
 
-        R.append(fig1)
+@app.callback(
+    [Output('whatif-%d' % i, 'value') for i in range(len(food_groups))],
+    [Input('whatif-country', 'value'),
+     Input('measure','value')]
+)
+@metrics.instrumented()
+def update_whatif_shares(country, measure):
+    return [round(share, 1) for share in countryindex.food_vector(country, measure)]
 
-    return R[0],R[1],R[2]
+@app.callback(
+    Output('whatif-result','children'),
+    [Input('measure','value')] +
+    [Input('whatif-%d' % i, 'value') for i in range(len(food_groups))]
+)
+@metrics.instrumented()
+def update_whatif(measure, *shares):
+    # Models are loaded already, this is one matrix product
+    prediction = models.predict(shares, measure)
+    scores = models.scores(measure)
+
+    def regression(name, fmt):
+        if not models.informative(name, measure):
+            return 'not shown, CV R² {:.2f}'.format(scores[name])
+        return (fmt + ' (CV R² {:.2f})').format(prediction[name][0], scores[name])
+
+    return dcc.Markdown('''
+    **HOC probability:** {:.0%} (CV accuracy {:.2f})
 
+    **Predicted Obesity:** {}
 
+    **Predicted Mortality:** {}
+
+    Shares add up to {:.1f}%.
+    '''.format(prediction['hoc'][0], scores['hoc'],
+               regression('obesity', '{:.1f}%'),
+               regression('mortality', '{:.4f}'), sum(shares)))
 
 
 @app.callback(
-    Output('ftext','children'),
-    [Input('map', 'clickData')]
+    Output('dt-similar', 'data'),
+    [Input('similar-country', 'value'),
+     Input('similar-k', 'value'),
+     Input('measure','value')]
 )
-def test(click):
-    if click == None:
-        return 'Select a country by clicking on map.'
-    else:
-        return click['points'][0]['hovertext'] + ' selected - info in red.'
+@metrics.instrumented()
+def update_similar(country, k, measure):
+    # Orderings are precomputed, this only slices them
+    return neighbours.records(country, k, measure)
+
+
+@app.callback(
+    Output('cluster-graph','figure'),
+    Output('cluster-sweep','figure'),
+    [Input('cluster-method','value'),
+     Input('cluster-k','value'),
+     Input('cluster-x','value'),
+     Input('cluster-y','value'),
+     Input('cluster-pair','value'),
+     Input('measure','value')]
+)
+@metrics.instrumented()
+@figure_cache.cached()
+def update_clusters(method, k, x, y, pair, measure):
+    # Fits are kept per dataset, method, features and k
+    features = [x, y] if pair else None
+    return (clusters.figure(method, k, x, y, features, measure),
+            clusters.sweep_figure(method, k, features, measure))
+
+if clientside.ENABLED:
+    app.clientside_callback(ClientsideFunction('healthy', 'selected_text'),
+        Output('ftext','children'), [Input('map', 'clickData')])
+else:
+    app.callback(Output('ftext','children'), [Input('map', 'clickData')])(test)
+
+startup.emit()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,52 @@
+"""Bar charts of every country with the clicked one highlighted.
+
+The bars of each feature are sorted once (through ``ranks``) and kept as a
+base figure. A click on the map only swaps the marker colour array of a
+copy of that figure, instead of sorting the data and rebuilding the chart.
+"""
+import numpy as np
+import plotly.express as px
+
+import datasets
+import ranks
+
+## Features shown under the map
+FEATURES = ['Obesity', 'Undernourished', 'Animal Products']
+
+HIGHLIGHT_COLOR = '#ff0000'
+BASE_COLOR = '#00cc44'
+
+## (dataset version, feature) -> (figure dict, countries in bar order)
+_base = datasets.register_cache({}, lambda key: key[0])
+
+
+def title(feature, measure=datasets.DEFAULT_MEASURE):
+    if feature == 'Obesity' or feature == 'Undernourished':
+        return feature + " rate - Percentage of total population"
+    return "% of " + feature + " intake (" + datasets.info(measure)['unit'] + ")"
+
+
+def base_figure(feature, measure=datasets.DEFAULT_MEASURE):
+    key = (datasets.version(measure), feature)
+    if key not in _base:
+        df = ranks.top_window(feature, 1, len(datasets.supply(measure)), measure)
+        fig = px.bar(df, x = "Country", y = feature, title = title(feature, measure))
+        fig.update_traces(marker_color = BASE_COLOR)
+        _base[key] = (fig.to_plotly_json(), df['Country'].values)
+    return _base[key]
+
+
+def highlight(feature, country, measure=datasets.DEFAULT_MEASURE):
+    """Figure dict for ``feature`` with the bar of ``country`` in red."""
+    fig, countries = base_figure(feature, measure)
+    colors = np.where(countries == country, HIGHLIGHT_COLOR, BASE_COLOR)
+
+    # Shallow copies, the cached base figure is never modified
+    trace = dict(fig['data'][0], marker=dict(fig['data'][0]['marker'], color=colors.tolist()))
+    return dict(fig, data=[trace] + list(fig['data'][1:]))
+
+
+def build_all(measures=None):
+    for measure in measures or datasets.DATASETS:
+        for feature in FEATURES:
+            base_figure(feature, measure)
@@ -0,0 +1,67 @@
+"""Server side binned histograms of food intake by obesity group.
+
+Instead of sending every country to the browser and letting plotly.js bin
+them (``px.histogram``), the bin edges and the counts of each obesity group
+are computed with ``numpy.histogram`` and drawn as plain bar traces. Bins
+are cached per (dataset version, column, number of bins).
+"""
+import numpy as np
+import plotly.graph_objs as go
+
+import datasets
+
+## Colors of the ObesityAboveAvg groups and of their median lines
+GROUP_COLORS = {0: '#636efa', 1: '#EF553B'}
+MEDIAN_COLORS = {0: 'darkblue', 1: 'crimson'}
+
+## (dataset version, column, nbins) -> bins dict
+_bins = datasets.register_cache({}, lambda key: key[0])
+
+
+def compute_bins(df, column, nbins):
+    values = df[column].values.astype(float)
+    groups = df['ObesityAboveAvg'].values
+    edges = np.histogram_bin_edges(values, bins=nbins)
+    counts = {}
+    medians = {}
+    for group in (0, 1):
+        counts[group] = np.histogram(values[groups == group], bins=edges)[0]
+        medians[group] = float(np.median(values[groups == group]))
+    return {'edges': edges, 'counts': counts, 'medians': medians}
+
+
+def bins(column, nbins=50, measure=datasets.DEFAULT_MEASURE):
+    key = (datasets.version(measure), column, nbins)
+    if key not in _bins:
+        _bins[key] = compute_bins(datasets.supply(measure), column, nbins)
+    return _bins[key]
+
+
+def figure(column, nbins=50, measure=datasets.DEFAULT_MEASURE):
+    """Stacked histogram of ``column`` per obesity group, with median lines."""
+    b = bins(column, nbins, measure)
+    edges = b['edges']
+    centers = (edges[:-1] + edges[1:]) / 2
+    ranges = np.column_stack([edges[:-1], edges[1:]])
+
+    fig = go.Figure()
+    for group in (0, 1):
+        fig.add_trace(go.Bar(
+            x = centers, y = b['counts'][group], width = np.diff(edges),
+            customdata = ranges, name = str(group), legendgroup = str(group),
+            marker_color = GROUP_COLORS[group],
+            hovertemplate = ('ObesityAboveAvg=%d<br>%s=%%{customdata[0]:.4g} - %%{customdata[1]:.4g}'
+                             '<br>count=%%{y}<extra></extra>' % (group, column))))
+
+    # Median lines reach the top of the highest stacked bar
+    top = int((b['counts'][0] + b['counts'][1]).max())
+    for group in (0, 1):
+        fig.add_shape(type="line",
+                      x0=b['medians'][group], y0=0,
+                      x1=b['medians'][group], y1=top,
+                      line=dict(color=MEDIAN_COLORS[group], width=4))
+
+    fig.update_layout(barmode='relative', bargap=0,
+                      xaxis_title=column, yaxis_title='count',
+                      legend_title_text='ObesityAboveAvg', margin={'t': 60})
+    return fig
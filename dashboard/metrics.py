@@ -0,0 +1,96 @@
+"""Prometheus metrics for the Dash callbacks.
+
+Every callback wrapped with ``instrumented`` records its latency, and the
+size of the response Dash sends back for it is recorded by a Flask hook.
+Figure cache hits and misses are reported from ``figcache``. Everything is
+served in the Prometheus text format on ``/metrics``.
+
+Under gunicorn with several workers, set ``prometheus_multiproc_dir`` to an
+empty directory so ``/metrics`` aggregates all workers (cache counters are
+then per worker).
+"""
+import functools
+import os
+import time
+
+import flask
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Histogram, generate_latest)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from figcache import figure_cache
+
+LATENCY = Histogram(
+    'dash_callback_latency_seconds', 'Time spent in a Dash callback',
+    ['callback'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+
+RESPONSE_SIZE = Histogram(
+    'dash_callback_response_bytes', 'Size of the serialized callback response',
+    ['callback'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+
+
+class FigureCacheCollector:
+
+    def collect(self):
+        stats = figure_cache.stats()
+        hits = CounterMetricFamily('dash_figure_cache_hits', 'Figure cache hits',
+                                   labels=['callback'])
+        misses = CounterMetricFamily('dash_figure_cache_misses', 'Figure cache misses',
+                                     labels=['callback'])
+        for name, value in stats['hits'].items():
+            hits.add_metric([name], value)
+        for name, value in stats['misses'].items():
+            misses.add_metric([name], value)
+        yield hits
+        yield misses
+        yield CounterMetricFamily('dash_figure_cache_evictions',
+                                  'Figure cache LRU evictions', value=stats['evictions'])
+        yield GaugeMetricFamily('dash_figure_cache_entries',
+                                'Figures held in memory', value=stats['size'])
+
+
+def instrumented(name=None):
+    """Decorator recording the latency of a callback."""
+    def decorator(func):
+        cb_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            if flask.has_request_context():
+                flask.g.callback_name = cb_name
+            t0 = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                LATENCY.labels(cb_name).observe(time.perf_counter() - t0)
+        return wrapper
+    return decorator
+
+
+def _record_size(response):
+    name = flask.g.get('callback_name')
+    if name and not response.direct_passthrough:
+        RESPONSE_SIZE.labels(name).observe(len(response.get_data()))
+    return response
+
+
+def _metrics():
+    if os.environ.get('prometheus_multiproc_dir'):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(FigureCacheCollector())
+    else:
+        registry = REGISTRY
+    return flask.Response(generate_latest(registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+
+def init_app(app):
+    """Add the response size hook and the ``/metrics`` route to a Dash app."""
+    if not os.environ.get('prometheus_multiproc_dir'):
+        REGISTRY.register(FigureCacheCollector())
+    app.server.after_request(_record_size)
+    app.server.add_url_rule('/metrics', 'metrics', _metrics)
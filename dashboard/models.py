@@ -0,0 +1,178 @@
+"""Models of the notebook, trained on the food group shares.
+
+For each dataset three models are fitted on the cleaned ``food_groups``
+columns: a HOC/LOC classifier (``ObesityAboveAvg``) and ridge regressors
+for ``Obesity`` and ``Mortality``, whose alpha is chosen by cross
+validation. Regressor predictions are clipped to the valid range of their
+target, and ``informative`` tells whether a regressor does better than the
+mean at all. They are trained at build time and saved with joblib in
+``./cache``, keyed on the dataset version; a worker only loads them. Run
+``python models.py`` to train them before starting the server.
+
+Every model is a standard scaler followed by a linear model, so prediction
+is folded into a single weight matrix: ``predict`` scores any number of
+rows with one matrix product and never calls scikit-learn.
+
+When a reload brings a new version, the models of the previous one keep
+answering while the new ones are trained in a background thread.
+"""
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+from sklearn.linear_model import LogisticRegression, RidgeCV
+from sklearn.model_selection import cross_val_score
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+import datasets
+from datastore import food_groups
+from storage import cache_path, write_atomic
+
+## Bump when TARGETS or the training change, so saved models are not reused
+MODELS_VERSION = 2
+
+## Regularization strengths tried by the inner cross validation. The 21
+## shares add up to 100, so the regressors need strong shrinkage.
+ALPHAS = np.logspace(-2, 4, 25)
+
+## name -> (target column, estimator factory, cross validation scoring)
+TARGETS = OrderedDict([
+    ('hoc', ('ObesityAboveAvg', lambda: LogisticRegression(max_iter=1000), 'accuracy')),
+    ('obesity', ('Obesity', lambda: RidgeCV(alphas=ALPHAS), 'r2')),
+    ('mortality', ('Mortality', lambda: RidgeCV(alphas=ALPHAS), 'r2')),
+])
+
+## name -> (lowest, highest) valid prediction of the regressors
+RANGES = {
+    'obesity': (0, 100),
+    'mortality': (0, None),
+}
+
+## dataset version -> {'models': fitted pipelines, 'scores': ..., 'weights': ..., 'bias': ...}
+_models = datasets.register_cache({})
+## measure -> models of the newest version loaded for it
+_latest = {}
+_training = set()
+_lock = threading.Lock()
+
+
+def _path(version):
+    key = hashlib.sha1(version.encode()).hexdigest()[:16]
+    return cache_path('models-v%d-%s.joblib' % (MODELS_VERSION, key))
+
+
+def train(df):
+    """Fit the pipelines of every target on the rows of ``df``."""
+    fitted = OrderedDict()
+    scores = OrderedDict()
+    for name, (target, estimator, scoring) in TARGETS.items():
+        rows = df[np.isfinite(df[target])]
+        X = rows[food_groups].values
+        y = rows[target].values
+        pipeline = make_pipeline(StandardScaler(), estimator())
+        scores[name] = cross_val_score(pipeline, X, y, cv=5, scoring=scoring).mean()
+        fitted[name] = pipeline.fit(X, y)
+    return fitted, scores
+
+
+def fold(pipeline):
+    """Weights and bias of the scaler and linear model composed."""
+    scaler, model = pipeline.steps[0][1], pipeline.steps[-1][1]
+    coef = np.ravel(model.coef_) / scaler.scale_
+    intercept = np.ravel(model.intercept_)[0] - coef.dot(scaler.mean_)
+    return coef, intercept
+
+
+def _entry(fitted, scores):
+    folded = [fold(pipeline) for pipeline in fitted.values()]
+    return {
+        'models': fitted,
+        'scores': scores,
+        # One column of weights per target
+        'weights': np.column_stack([coef for coef, _ in folded]),
+        'bias': np.array([intercept for _, intercept in folded]),
+    }
+
+
+def load_or_train(measure=datasets.DEFAULT_MEASURE, version=None):
+    version = version or datasets.version(measure)
+    path = _path(version)
+    if os.path.exists(path):
+        fitted, scores = joblib.load(path)
+    else:
+        fitted, scores = train(datasets.supply(measure))
+        write_atomic(path, lambda tmp: joblib.dump((fitted, scores), tmp))
+    return _entry(fitted, scores)
+
+
+def _train_in_background(measure, version):
+    def run():
+        try:
+            entry = load_or_train(measure, version)
+            with _lock:
+                _models[version] = entry
+                _latest[measure] = entry
+        finally:
+            with _lock:
+                _training.discard(version)
+
+    with _lock:
+        if version in _training:
+            return
+        _training.add(version)
+    threading.Thread(target=run, name='train-models', daemon=True).start()
+
+
+def models(measure=datasets.DEFAULT_MEASURE):
+    """Models of the current version, or the previous ones while training."""
+    version = datasets.version(measure)
+    entry = _models.get(version)
+    if entry is not None:
+        return entry
+    if measure in _latest:
+        _train_in_background(measure, version)
+        return _latest[measure]
+    entry = _models[version] = _latest[measure] = load_or_train(measure, version)
+    return entry
+
+
+def build_all():
+    for measure in datasets.DATASETS:
+        models(measure)
+
+
+def predict(X, measure=datasets.DEFAULT_MEASURE):
+    """Predictions for the rows of ``X`` (food group shares).
+
+    Returns a dict of arrays: the probability of being a HOC country and
+    the predicted ``Obesity`` and ``Mortality``, clipped to ``RANGES``.
+    """
+    entry = models(measure)
+    z = np.atleast_2d(np.asarray(X, dtype=float)).dot(entry['weights']) + entry['bias']
+    return {
+        'hoc': 1.0 / (1.0 + np.exp(-z[:, 0])),
+        'obesity': np.clip(z[:, 1], *RANGES['obesity']),
+        'mortality': np.clip(z[:, 2], *RANGES['mortality']),
+    }
+
+
+def scores(measure=datasets.DEFAULT_MEASURE):
+    """Cross validation score of every model."""
+    return models(measure)['scores']
+
+
+def informative(name, measure=datasets.DEFAULT_MEASURE):
+    """Whether the regressor ``name`` predicts better than the mean (CV R² > 0)."""
+    return scores(measure)[name] > 0
+
+
+if __name__ == '__main__':
+    datasets.load_all()
+    for measure in sys.argv[1:] or datasets.DATASETS:
+        entry = models(measure)
+        print(_path(datasets.version(measure)), dict(entry['scores']))
@@ -0,0 +1,59 @@
+"""Countries with the most similar diets.
+
+Diets are compared by the cosine similarity of their food group shares.
+For each dataset version the rows of the food matrix are normalized once,
+all the pairwise similarities computed with one matrix product and every
+row argsorted, so finding the k most similar countries is a slice of a
+precomputed ordering.
+"""
+import numpy as np
+
+import countryindex
+import datasets
+
+## Outcomes shown next to the neighbours
+OUTCOMES = ['Obesity', 'Confirmed', 'Deaths', 'Mortality']
+DEFAULT_K = 10
+
+## dataset version -> {'similarity': matrix, 'order': most similar first}
+_indexes = datasets.register_cache({})
+
+
+def build_index(food):
+    norms = np.linalg.norm(food, axis=1, keepdims=True)
+    unit = food / np.where(norms == 0, 1, norms)
+    similarity = unit.dot(unit.T)
+    # A country is not its own neighbour
+    np.fill_diagonal(similarity, -np.inf)
+    return {
+        'similarity': similarity,
+        'order': np.argsort(-similarity, axis=1, kind='stable'),
+    }
+
+
+def index(measure=datasets.DEFAULT_MEASURE):
+    version = datasets.version(measure)
+    if version not in _indexes:
+        _indexes[version] = build_index(countryindex.index(measure)['food'])
+    return _indexes[version]
+
+
+def build_all():
+    for measure in datasets.DATASETS:
+        index(measure)
+
+
+def most_similar(country, k=DEFAULT_K, measure=datasets.DEFAULT_MEASURE):
+    """Row positions and similarities of the ``k`` closest diets."""
+    idx = index(measure)
+    row = countryindex.index(measure)['position'][country]
+    positions = idx['order'][row, :k]
+    return positions, idx['similarity'][row, positions]
+
+
+def records(country, k=DEFAULT_K, measure=datasets.DEFAULT_MEASURE):
+    """Table records of the ``k`` closest diets with their outcomes."""
+    positions, similarity = most_similar(country, k, measure)
+    df = datasets.supply(measure)[['Country'] + OUTCOMES].iloc[positions]
+    df.insert(1, 'Similarity', similarity)
+    return df.round(4).to_dict('records')
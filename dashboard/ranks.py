@@ -0,0 +1,44 @@
+"""Pre-computed rank orderings for the top-N bar charts.
+
+Each numeric column of every dataset is sorted once and kept as an array of
+row positions in descending order, so a slider window is just a slice of
+that array and never needs a sort.
+"""
+import datasets
+
+## dataset version -> {column: row positions, highest value first}
+_ranks = datasets.register_cache({})
+
+
+def rank_index(df):
+    ranks = {}
+    for col in df.select_dtypes('number').columns:
+        # Same ordering as df.sort_values(col, ascending=False)
+        order = df[col].sort_values(ascending=False).index
+        ranks[col] = df.index.get_indexer(order)
+    return ranks
+
+
+def ranks(measure=datasets.DEFAULT_MEASURE):
+    version = datasets.version(measure)
+    if version not in _ranks:
+        df = datasets.supply(measure)
+        parent = datasets.changed_since(version)
+        if parent and parent[0] in _ranks:
+            # New COVID data, only re-sort the columns that changed
+            ranks = dict(_ranks[parent[0]])
+            ranks.update(rank_index(df[parent[1]]))
+            _ranks[version] = ranks
+        else:
+            _ranks[version] = rank_index(df)
+    return _ranks[version]
+
+
+def build_all():
+    for measure in datasets.DATASETS:
+        ranks(measure)
+
+
+def top_window(column, start, end, measure=datasets.DEFAULT_MEASURE):
+    """Rows ranked ``start`` to ``end`` (1-based, inclusive) by ``column``."""
+    return datasets.supply(measure).iloc[ranks(measure)[column][start-1:end]]
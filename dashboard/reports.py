@@ -0,0 +1,40 @@
+"""Figures of a single country.
+
+The food intake pie, the animal/vegetal bar chart, the highlighted feature
+bars and the COVID table row of one country, shared by the callbacks of
+healthy-dash.py and the static export in export.py.
+"""
+import plotly.express as px
+
+import countryindex
+import datasets
+import highlight
+from datastore import food_groups
+
+## colors for bar graph
+COLORS = ['IndianRed', 'DarkSeaGreen']
+
+
+def food_pie(country, measure=datasets.DEFAULT_MEASURE):
+    fig = px.pie(values = countryindex.food_vector(country, measure).tolist(), names = food_groups,
+             title=datasets.info(measure)['intake'] + ' ' + country)
+    fig.update_traces(textposition='inside', textinfo='percent+label')
+    return fig
+
+
+def animal_vegetal_bar(country, measure=datasets.DEFAULT_MEASURE):
+    return px.bar(countryindex.row(country, measure, ['Country','Animal Products', 'Vegetal Products']),
+        x = 'Country', y = ['Animal Products', 'Vegetal Products'],
+        barmode = 'group',
+        color_discrete_sequence = COLORS,
+        title ='% of Animal and Vegetal products intake (' + datasets.info(measure)['unit'] + ') <br> - '+country)
+
+
+def highlight_bars(country, measure=datasets.DEFAULT_MEASURE):
+    """Pre-sorted bar chart of each feature with ``country`` in red."""
+    return tuple(highlight.highlight(feat, country, measure)
+                 for feat in highlight.FEATURES)
+
+
+def covid_record(country, measure=datasets.DEFAULT_MEASURE):
+    return countryindex.covid_records([country], measure)[0]
@@ -0,0 +1,150 @@
+"""Significance of the food intake differences between obesity groups.
+
+For every food column of a dataset the difference of the mean or median
+share between high (HOC) and low (LOC) obesity countries is tested at once:
+
+* a permutation test, shuffling the group labels, gives a two-sided
+  p-value;
+* a bootstrap, resampling each group with replacement, gives a 95%
+  confidence interval of the difference.
+
+Resamples are index matrices (one row per resample) applied to the whole
+food matrix, so each chunk of resamples is a handful of NumPy operations
+over every column. Chunks are seeded from one ``SeedSequence``, which
+gives the same results whether they run here or in a process pool (set
+``HEALTHY_STATS_PROCESSES`` or pass ``processes``).
+
+Results are cached per (dataset version, statistic, resamples) in memory
+and in ``./cache``; ``python significance.py`` computes them for every
+dataset ahead of time.
+"""
+import hashlib
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import datasets
+from datastore import food_columns
+from storage import cache_path, read_json, write_json
+
+STATISTICS = OrderedDict([('median', np.median), ('mean', np.mean)])
+RESAMPLES = int(os.environ.get('HEALTHY_RESAMPLES', '5000'))
+PROCESSES = int(os.environ.get('HEALTHY_STATS_PROCESSES', '0'))
+## Resamples per chunk, bounds the size of the resampled arrays
+CHUNK = 500
+## Bump when the tests change, so results saved in ./cache are not reused
+TESTS_VERSION = 1
+SEED = 2020
+COLUMNS = ['Food group', 'HOC', 'LOC', 'Difference', 'CI low', 'CI high', 'p-value']
+
+## (dataset version, statistic, resamples) -> results frame
+_results = datasets.register_cache({}, lambda key: key[0])
+
+
+def difference(high, low, statistic):
+    """HOC minus LOC ``statistic`` of resampled arrays (resamples x rows x columns)."""
+    stat = STATISTICS[statistic]
+    return stat(high, axis=1) - stat(low, axis=1)
+
+
+def permutation_chunk(X, is_high, statistic, size, seed):
+    """Differences of ``size`` label permutations, one row each."""
+    rng = np.random.default_rng(seed)
+    n, n_high = len(X), int(is_high.sum())
+    order = np.argsort(rng.random((size, n)), axis=1)
+    return difference(X[order[:, :n_high]], X[order[:, n_high:]], statistic)
+
+
+def bootstrap_chunk(X, is_high, statistic, size, seed):
+    """Differences of ``size`` within group resamples, one row each."""
+    rng = np.random.default_rng(seed)
+    high, low = X[is_high], X[~is_high]
+    high_idx = rng.integers(0, len(high), (size, len(high)))
+    low_idx = rng.integers(0, len(low), (size, len(low)))
+    return difference(high[high_idx], low[low_idx], statistic)
+
+
+def _run_chunk(kind, X, is_high, statistic, size, seed):
+    chunk = permutation_chunk if kind == 'permutation' else bootstrap_chunk
+    return chunk(X, is_high, statistic, size, seed)
+
+
+def resample(kind, X, is_high, statistic, resamples, processes=0):
+    sizes = [min(CHUNK, resamples - start) for start in range(0, resamples, CHUNK)]
+    seeds = np.random.SeedSequence([SEED, kind == 'bootstrap']).spawn(len(sizes))
+    args = [[kind] * len(sizes), [X] * len(sizes), [is_high] * len(sizes),
+            [statistic] * len(sizes), sizes, seeds]
+    if processes > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(processes) as pool:
+            chunks = list(pool.map(_run_chunk, *args))
+    else:
+        chunks = list(map(_run_chunk, *args))
+    return np.vstack(chunks)
+
+
+def compute(df, statistic='median', resamples=RESAMPLES, processes=0):
+    """Test results of every food column of ``df``, one row each.
+
+    The p-value is ``(count(|null| >= |observed|) + 1) / (resamples + 1)``
+    over the permutation differences. This is not the definition of
+    ``scipy.stats.permutation_test`` (twice the smaller one-sided p-value),
+    and the two differ on tied, discrete columns.
+    """
+    X = df[food_columns].values.astype(float)
+    is_high = df['ObesityAboveAvg'].values == 1
+    stat = STATISTICS[statistic]
+    high, low = stat(X[is_high], axis=0), stat(X[~is_high], axis=0)
+    observed = high - low
+
+    null = resample('permutation', X, is_high, statistic, resamples, processes)
+    extreme = (np.abs(null) >= np.abs(observed) - 1e-12).sum(axis=0)
+    boot = resample('bootstrap', X, is_high, statistic, resamples, processes)
+    ci_low, ci_high = np.percentile(boot, [2.5, 97.5], axis=0)
+
+    return pd.DataFrame(OrderedDict(zip(COLUMNS, [
+        food_columns, high, low, observed, ci_low, ci_high,
+        (extreme + 1) / (resamples + 1)])))
+
+
+def _path(version, statistic, resamples):
+    key = hashlib.sha1(version.encode()).hexdigest()[:16]
+    return cache_path('significance-v%d-%s-%s-%d.json' % (TESTS_VERSION, key, statistic, resamples))
+
+
+def results(statistic='median', measure=datasets.DEFAULT_MEASURE,
+            resamples=RESAMPLES, processes=None):
+    """Test results of every food column, one row each."""
+    version = datasets.version(measure)
+    key = (version, statistic, resamples)
+    if key not in _results:
+        path = _path(*key)
+        if os.path.exists(path):
+            df = pd.DataFrame(read_json(path), columns=COLUMNS)
+        else:
+            df = compute(datasets.supply(measure), statistic, resamples,
+                         PROCESSES if processes is None else processes)
+            write_json(path, df.to_dict('records'))
+        _results[key] = df
+    return _results[key]
+
+
+def build_all(processes=None):
+    for measure in datasets.DATASETS:
+        for statistic in STATISTICS:
+            results(statistic, measure, processes=processes)
+
+
+def records(statistic='median', measure=datasets.DEFAULT_MEASURE):
+    return results(statistic, measure).round(4).to_dict('records')
+
+
+if __name__ == '__main__':
+    datasets.load_all()
+    build_all(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    for measure in datasets.DATASETS:
+        for statistic in STATISTICS:
+            print(_path(datasets.version(measure), statistic, RESAMPLES))
@@ -0,0 +1,96 @@
+"""Optional profiling of the app start up.
+
+Set ``HEALTHY_PROFILE_STARTUP=1`` to get, once the app module is imported,
+one JSON line on stderr with the wall time and peak traced memory of each
+start up phase (imports, data loading, precomputation, layout). Any other
+value is taken as a file the line is appended to, which makes it easy to
+compare cold starts across deploys.
+
+Memory tracing slows everything down noticeably, so compare wall times of
+profiled runs with each other rather than with normal start ups. When the
+variable is not set ``phase`` does nothing.
+"""
+import json
+import os
+import socket
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+SETTING = os.environ.get('HEALTHY_PROFILE_STARTUP', '')
+ENABLED = SETTING not in ('', '0')
+
+_phases = []
+_stack = []
+_started = time.time()
+
+if ENABLED:
+    tracemalloc.start()
+
+
+def _max_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def begin(name):
+    """Start timing phase ``name``, nested in the current phase if any."""
+    if not ENABLED:
+        return
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    _stack.append((name, time.perf_counter(), tracemalloc.get_traced_memory()[0]))
+
+
+def end():
+    """Stop timing the innermost phase."""
+    if not ENABLED:
+        return
+    t1 = time.perf_counter()
+    current, peak = tracemalloc.get_traced_memory()
+    full_name = '/'.join(name for name, _, _ in _stack)
+    name, t0, mem_before = _stack.pop()
+    _phases.append({
+        'phase': full_name,
+        'wall_ms': round((t1 - t0) * 1000, 2),
+        'mem_delta_kb': round((current - mem_before) / 1024, 1),
+        # Without reset_peak (Python < 3.9) this is the peak so far
+        'mem_peak_kb': round(peak / 1024, 1),
+    })
+
+
+@contextmanager
+def phase(name):
+    begin(name)
+    try:
+        yield
+    finally:
+        end()
+
+
+def report():
+    return {
+        'event': 'startup',
+        'host': socket.gethostname(),
+        'pid': os.getpid(),
+        'total_ms': round((time.time() - _started) * 1000, 2),
+        'max_rss_kb': _max_rss_kb(),
+        'phases': list(_phases),
+    }
+
+
+def emit():
+    if not ENABLED:
+        return
+    line = json.dumps(report())
+    if SETTING == '1':
+        print(line, file=sys.stderr)
+    else:
+        with open(SETTING, 'a') as f:
+            f.write(line + '\n')
+    # Tracing slows down every allocation, don't keep it for the requests
+    tracemalloc.stop()
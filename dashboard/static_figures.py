@@ -0,0 +1,138 @@
+"""Figures of the page that do not depend on any input.
+
+Building them used to happen while the app module was imported, delaying
+every worker. Here each one is a provider function that only runs the
+first time the figure is needed; the result is kept as JSON in memory and
+in ``./cache``, keyed on the data version, so other workers (and restarts)
+load it instead of rebuilding it.
+
+``lazy(name)`` is what goes in the layout: Dash serializes it through its
+``to_plotly_json`` method when the layout is first requested. Run
+``python static_figures.py`` to pre-render every figure at build time.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.express as px
+import plotly.utils
+
+import datasets
+import trendlines
+from storage import cache_path, write_atomic
+
+## Bump when a provider changes, so figures rendered to ./cache are rebuilt
+FIGURES_VERSION = 1
+
+## name -> function building the figure
+_providers = OrderedDict()
+## (data version, name) -> figure dict
+_rendered = datasets.register_cache({}, lambda key: key[0])
+_lock = threading.Lock()
+
+
+def provider(name):
+    def decorator(func):
+        _providers[name] = func
+        return func
+    return decorator
+
+
+def _version_key():
+    return hashlib.sha1(datasets.data_version().encode()).hexdigest()[:16]
+
+
+def _path(name):
+    return cache_path('figures-v%d-%s-%s.json' % (FIGURES_VERSION, _version_key(), name))
+
+
+def get(name):
+    """Figure ``name`` as a plain dict, building it at most once.
+
+    The returned dict is shared, callers must not modify it.
+    """
+    key = (datasets.data_version(), name)
+    if key in _rendered:
+        return _rendered[key]
+
+    with _lock:
+        if key in _rendered:
+            return _rendered[key]
+        path = _path(name)
+        if os.path.exists(path):
+            with open(path) as f:
+                text = f.read()
+        else:
+            text = json.dumps(_providers[name](), cls=plotly.utils.PlotlyJSONEncoder)
+
+            def write(tmp):
+                with open(tmp, 'w') as f:
+                    f.write(text)
+            write_atomic(path, write)
+        _rendered[key] = json.loads(text)
+    return _rendered[key]
+
+
+class LazyFigure:
+    """Placeholder for a figure in the layout, rendered on serialization."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def to_plotly_json(self):
+        return get(self.name)
+
+
+def lazy(name):
+    if name not in _providers:
+        raise KeyError('No figure provider named %r' % name)
+    return LazyFigure(name)
+
+
+def prerender():
+    for name in _providers:
+        get(name)
+
+
+###############################################################################
+################ PROVIDERS ####################################################
+###############################################################################
+@provider('deaths-v-conf')
+def deaths_v_conf():
+    kg_df = datasets.supply()
+    return trendlines.scatter_ols(kg_df, x="Confirmed", y = "Deaths",size = "Active", hover_name='Country',
+                 size_max=30, template="simple_white",
+                 title='Deaths vs. Confirmed - Size corresponds to Active cases')
+
+
+@provider('ob-v-deaths')
+def ob_v_deaths():
+    kg_df = datasets.supply()
+    return (px.scatter(kg_df, x="Deaths", y = "Obesity", size = "Mortality",
+                hover_name='Country', log_x=False, size_max=30, template="simple_white",
+                title='Obesity rate vs. Deaths - Size corresponds to Mortality')
+                .add_shape(
+                        type="line",
+                        x0=0,
+                        y0=kg_df['Obesity'].mean(),
+                        x1=kg_df['Deaths'].max(),
+                        y1=kg_df['Obesity'].mean(),
+                        line=dict(
+                            color="crimson",
+                            width=4
+                        )
+                    ))
+
+
+@provider('death-obesity')
+def death_obesity():
+    return (px.bar(datasets.supply(), x = "Country", y ="Deaths", facet_col = "ObesityAboveAvg")
+            .update_xaxes(matches=None,categoryorder="total descending"))
+
+
+if __name__ == '__main__':
+    prerender()
+    for name in _providers:
+        print(_path(name))
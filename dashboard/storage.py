@@ -0,0 +1,56 @@
+"""Paths and small helpers for the on-disk cache shared by all workers."""
+import hashlib
+import json
+import os
+import tempfile
+
+DATA_DIR = os.environ.get('HEALTHY_DATA_DIR', './data')
+CACHE_DIR = os.environ.get('HEALTHY_CACHE_DIR', './cache')
+
+
+def data_path(name):
+    return os.path.join(DATA_DIR, name)
+
+
+def cache_path(name):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, name)
+
+
+def file_digest(*paths):
+    """Short sha1 over the contents of ``paths``, used as a cache key."""
+    h = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def write_atomic(path, write):
+    """Call ``write(tmp_path)`` and move the result into place.
+
+    Workers booting at the same time may race to build the same cache
+    entry; the rename makes sure readers never see a half-written file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                               prefix='.tmp-')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, obj):
+    def write(tmp):
+        with open(tmp, 'w') as f:
+            json.dump(obj, f)
+    write_atomic(path, write)
@@ -0,0 +1,112 @@
+"""Server side paging, sorting and filtering of the COVID table.
+
+The ``dt-covid`` DataTable runs with ``page_action``, ``sort_action`` and
+``filter_action`` set to ``'custom'``: it only ever receives the rows of
+the page on screen. Rows are picked from the pre-indexed frame through
+``countryindex``, sorted with the orderings kept by ``ranks`` and filtered
+with vectorized pandas comparisons.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+import countryindex
+import datasets
+import ranks
+
+PAGE_SIZE = 10
+
+## Operators understood in filter_query, longest first
+OPERATORS = [['ge ', '>='],
+             ['le ', '<='],
+             ['lt ', '<'],
+             ['gt ', '>'],
+             ['ne ', '!='],
+             ['eq ', '='],
+             ['contains '],
+             ['datestartswith ']]
+
+
+def split_filter_part(filter_part):
+    """Split ``{col} op value`` into ``(col, op, value)``."""
+    for operator_type in OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ''
+                if v0 and v0 == value_part[-1] and v0 in ("'", '"', '`'):
+                    value = value_part[1: -1].replace('\\' + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                # word operators need spaces after them in the filter string,
+                # but we don't want these later
+                return name, operator_type[0].strip(), value
+
+    return None, None, None
+
+
+def filter_mask(df, filter_query):
+    mask = np.ones(len(df), dtype=bool)
+    for filter_part in (filter_query or '').split(' && '):
+        col_name, operator, value = split_filter_part(filter_part)
+        if col_name not in df.columns:
+            continue
+        col = df[col_name]
+        if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            # Ignore clauses like {Confirmed} lt abc, typed in the filter row
+            if pd.api.types.is_numeric_dtype(col) != isinstance(value, float):
+                continue
+            mask &= getattr(col, operator)(value).values
+        elif operator == 'contains':
+            mask &= col.astype(str).str.contains(str(value), case=False, regex=False).values
+        elif operator == 'datestartswith':
+            mask &= col.astype(str).str.startswith(str(value)).values
+    return mask
+
+
+def sorted_positions(positions, sort_by, measure=datasets.DEFAULT_MEASURE):
+    """Row ``positions`` reordered by the first ``sort_by`` entry."""
+    if not sort_by:
+        return positions
+    column = sort_by[0]['column_id']
+    ascending = sort_by[0]['direction'] == 'asc'
+
+    order = ranks.ranks(measure).get(column)
+    if order is None:
+        # Not a numeric column, sort the (few) selected rows directly
+        df = datasets.supply(measure)
+        values = df[column].values[positions]
+        order = np.asarray(positions)[np.argsort(values, kind='mergesort')]
+        return order.tolist() if ascending else order[::-1].tolist()
+
+    # Walk the precomputed ordering, keeping the selected rows
+    order = order[np.isin(order, positions)]
+    return order[::-1].tolist() if ascending else order.tolist()
+
+
+def query_page(countries, page_current=0, page_size=PAGE_SIZE, sort_by=None,
+               filter_query='', measure=datasets.DEFAULT_MEASURE):
+    """Records of one table page and the number of pages."""
+    positions = countryindex.positions(countries, measure)
+    df_covid = datasets.frames(measure)['df_covid']
+
+    if filter_query:
+        mask = filter_mask(df_covid.iloc[positions], filter_query)
+        positions = [p for p, keep in zip(positions, mask) if keep]
+
+    positions = sorted_positions(positions, sort_by, measure)
+
+    page_count = max(1, math.ceil(len(positions) / page_size))
+    page_current = min(page_current or 0, page_count - 1)
+    page = positions[page_current * page_size: (page_current + 1) * page_size]
+
+    records = countryindex.index(measure)['covid_records']
+    return [records[p] for p in page], page_count
@@ -0,0 +1,87 @@
+import logging
+import os
+
+import pandas as pd
+import pytest
+
+import datasets
+import datastore
+import timeseries
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPORT = os.path.join(HERE, 'fixtures', '10-01-2020.csv')
+ALIASES = os.path.join(os.path.dirname(HERE), 'data', 'csse_aliases.csv')
+
+POPULATION = pd.Series({
+    'United States of America': 10000.0,
+    'Russian Federation': 4000.0,
+    'Iran (Islamic Republic of)': 2000.0,
+    'Brazil': 8000.0,
+    'Chile': 1000.0,
+    'Myanmar': 500.0,
+})
+
+
+def read(path=REPORT):
+    return timeseries.read_report(path, POPULATION,
+                                  aliases=timeseries.load_aliases(ALIASES))
+
+
+def test_report_date():
+    assert str(timeseries.report_date(REPORT)) == '2020-10-01'
+
+
+def test_provinces_are_summed():
+    snapshot = read().set_index('Country')
+    # Texas + Ohio, in % of the population
+    assert snapshot.loc['United States of America', 'Confirmed'] == pytest.approx(15.0)
+    assert snapshot.loc['United States of America', 'Deaths'] == pytest.approx(0.3)
+    assert snapshot.loc['Russian Federation', 'Active'] == pytest.approx(6.05)
+
+
+def test_csse_names_are_mapped(caplog):
+    with caplog.at_level(logging.WARNING, logger='timeseries'):
+        snapshot = read()
+    assert set(snapshot['Country']) == set(POPULATION.index)
+    # Names without diet data are reported, not silently dropped
+    assert 'Diamond Princess' in caplog.text
+
+
+def test_ingesting_a_stored_date_replaces_it(tmp_path):
+    store_path = str(tmp_path / 'store.feather')
+    timeseries.append([read()], store_path)
+
+    updated = tmp_path / '10-01-2020.csv'
+    report = pd.read_csv(REPORT)
+    report.loc[report['Country_Region'] == 'Chile', 'Confirmed'] = 300
+    report.to_csv(updated, index=False)
+    store = timeseries.append([read(str(updated))], store_path)
+
+    assert store['date'].nunique() == 1
+    assert (store['Country'] == 'Chile').sum() == 1
+    latest = timeseries.latest(store_path)
+    assert latest.loc['Chile', 'Confirmed'] == pytest.approx(30.0)
+
+
+def test_mortality_is_recomputed(tmp_path):
+    df = pd.DataFrame({
+        'Country': ['Chile', 'Peru'],
+        'Obesity': [28.0, 19.7],
+        'Confirmed': [1.0, 2.0],
+        'Deaths': [0.1, 0.1],
+        'Recovered': [0.5, 1.0],
+        'Active': [0.4, 0.9],
+    })
+    df['Mortality'] = df['Deaths'] / df['Confirmed']
+    df['ObesityAboveAvg'] = (df['Obesity'] > df['Obesity'].mean()).astype(int)
+
+    store_path = str(tmp_path / 'store.feather')
+    timeseries.append([read()], store_path)
+    frames, changed = datasets.apply_covid(datastore.derive_frames(df),
+                                           timeseries.latest(store_path))
+
+    chile = frames['df'].set_index('Country').loc['Chile']
+    assert chile['Mortality'] == pytest.approx(4 / 200)
+    assert 'Mortality' in changed
+    # Countries missing from the report keep their values
+    assert frames['df'].set_index('Country').loc['Peru', 'Mortality'] == pytest.approx(0.05)
@@ -0,0 +1,130 @@
+"""Dated COVID-19 snapshots ingested from CSSE daily reports.
+
+The diet datasets ship a single COVID-19 snapshot. New data comes as the
+CSSE daily reports (one ``MM-DD-YYYY.csv`` file per day with absolute
+counts per country or province), which are converted to percentages of
+the population, like the original columns, and appended to a long,
+date-indexed Feather store (``date``, categorical ``Country`` and float32
+counts). The app overlays the most recent date of the store on the static
+data; running workers pick new dates up through ``datasets.reload``.
+
+    python timeseries.py 10-01-2020.csv 10-02-2020.csv ...
+
+Ingesting a date that is already stored replaces it, so re-running on the
+same files is harmless. CSSE names that differ from the names of the diet
+datasets are mapped through ``data/csse_aliases.csv``; countries that still
+don't match are logged and left out.
+"""
+import datetime
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+from storage import data_path, file_digest, write_atomic
+
+STORE_FILE = os.environ.get('HEALTHY_COVID_STORE', data_path('covid_timeseries.feather'))
+ALIASES_FILE = data_path('csse_aliases.csv')
+
+## COVID columns of the diet datasets, in % of the population
+COLUMNS = ['Confirmed', 'Deaths', 'Recovered', 'Active']
+
+
+def report_date(path):
+    """Date of a CSSE daily report, taken from its ``MM-DD-YYYY.csv`` name."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return datetime.datetime.strptime(name, '%m-%d-%Y').date()
+
+
+def load_aliases(path=ALIASES_FILE):
+    """CSSE country name -> name used by the diet datasets."""
+    df = pd.read_csv(path)
+    return dict(zip(df['csse_name'], df['Country']))
+
+
+def read_report(path, population, date=None, aliases=None):
+    """One CSSE daily report as a dated snapshot in % of the population.
+
+    ``population`` maps country names to their population. Provinces are
+    summed per country, after renaming CSSE names with ``aliases`` (read
+    from ``ALIASES_FILE`` by default). Countries still not in
+    ``population`` are logged and dropped.
+    """
+    if aliases is None:
+        aliases = load_aliases()
+    df = pd.read_csv(path)
+    country_col = 'Country_Region' if 'Country_Region' in df.columns else 'Country/Region'
+    df = df.rename(columns={country_col: 'Country'})
+    df['Country'] = df['Country'].replace(aliases)
+    if 'Active' not in df.columns:
+        df['Active'] = df['Confirmed'] - df['Deaths'] - df['Recovered']
+
+    counts = df.groupby('Country')[COLUMNS].sum()
+    known = counts.index.isin(population.index)
+    if not known.all():
+        logging.getLogger(__name__).warning(
+            '%s: no diet data for %s', os.path.basename(path),
+            ', '.join(counts.index[~known]))
+    counts = counts[known]
+    snapshot = counts.div(population[counts.index], axis=0) * 100
+
+    snapshot = snapshot.astype(np.float32).reset_index()
+    snapshot.insert(0, 'date', pd.Timestamp(date or report_date(path)))
+    return snapshot
+
+
+def load_store(path=STORE_FILE):
+    if not os.path.exists(path):
+        return None
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def append(snapshots, path=STORE_FILE):
+    """Add dated ``snapshots`` to the store, replacing dates already there."""
+    new = pd.concat(snapshots, ignore_index=True)
+    store = load_store(path)
+    if store is not None:
+        store = store[~store['date'].isin(new['date'].unique())]
+        new = pd.concat([store, new], ignore_index=True)
+
+    new['Country'] = new['Country'].astype(str).astype('category')
+    new = new.sort_values(['date', 'Country'], kind='mergesort').reset_index(drop=True)
+    write_atomic(path, lambda tmp: feather.write_feather(new, tmp))
+    return new
+
+
+def store_version(path=STORE_FILE):
+    """Short hash of the store, or None when nothing was ingested."""
+    return file_digest(path)[:8] if os.path.exists(path) else None
+
+
+def latest(path=STORE_FILE):
+    """Most recent values of each country, indexed by Country, or None.
+
+    Countries missing from the last report keep their previous values.
+    """
+    store = load_store(path)
+    if store is None or store.empty:
+        return None
+    # The store is sorted by date
+    last = store.drop_duplicates('Country', keep='last')
+    return last.set_index(last['Country'].astype(str))[COLUMNS].astype(float)
+
+
+def ingest(paths, store_path=STORE_FILE):
+    # Local import, datasets imports this module
+    import datasets
+
+    df = datasets.base_frames()['df']
+    population = df.set_index('Country')['Population']
+    return append([read_report(p, population) for p in paths], store_path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit('usage: python timeseries.py MM-DD-YYYY.csv [...]')
+    store = ingest(sys.argv[1:])
+    print('%s: %d dates, %d rows' % (STORE_FILE, store['date'].nunique(), len(store)))
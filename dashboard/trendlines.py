@@ -0,0 +1,73 @@
+"""Least squares trendlines for the scatter plots.
+
+``px.scatter(..., trendline="ols")`` fits a statsmodels regression each time
+a figure is built. The axes of the custom scatter plot only take four
+values, so the fits for every (x, y) pair are computed once with NumPy and
+the trendline trace is added from this store instead.
+"""
+import itertools
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objs as go
+
+import datasets
+
+## Values offered by the x-axis / y-axis radio items
+AXES = ['Deaths', 'Confirmed', 'Active', 'Obesity']
+
+## (dataset version, x, y) -> fit
+_fits = datasets.register_cache({}, lambda key: key[0])
+
+
+def fit_ols(x, y):
+    """Ordinary least squares fit of ``y = slope * x + intercept``."""
+    keep = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[keep], y[keep]
+    order = np.argsort(x, kind='mergesort')
+    x, y = x[order], y[order]
+
+    A = np.column_stack([np.ones_like(x), x])
+    (intercept, slope), *_ = np.linalg.lstsq(A, y, rcond=None)
+    fitted = intercept + slope * x
+
+    ss_res = ((y - fitted) ** 2).sum()
+    ss_tot = ((y - y.mean()) ** 2).sum()
+    return {
+        'slope': slope,
+        'intercept': intercept,
+        'rsquared': 1 - ss_res / ss_tot if ss_tot else 1.0,
+        'x': x,
+        'y': fitted,
+    }
+
+
+def fit(xcol, ycol, measure=datasets.DEFAULT_MEASURE):
+    key = (datasets.version(measure), xcol, ycol)
+    if key not in _fits:
+        df = datasets.supply(measure)
+        _fits[key] = fit_ols(df[xcol].values.astype(float), df[ycol].values.astype(float))
+    return _fits[key]
+
+
+def build_all():
+    for measure in datasets.DATASETS:
+        for xcol, ycol in itertools.product(AXES, AXES):
+            fit(xcol, ycol, measure)
+
+
+def trend_trace(xcol, ycol, measure=datasets.DEFAULT_MEASURE, color=None):
+    """Line trace for the fit, looking like the one plotly express makes."""
+    res = fit(xcol, ycol, measure)
+    hover = ('<b>OLS trendline</b><br>%s = %g * %s + %g<br>R<sup>2</sup>=%f<br><br>'
+             % (ycol, res['slope'], xcol, res['intercept'], res['rsquared']))
+    return go.Scatter(x=res['x'], y=res['y'], mode='lines', name='', showlegend=False,
+                      marker=dict(color=color),
+                      hovertemplate=hover + xcol + '=%{x}<br>' + ycol + '=%{y} <b>(trend)</b><extra></extra>')
+
+
+def scatter_ols(df, x, y, measure=datasets.DEFAULT_MEASURE, **kwargs):
+    """``px.scatter`` with an OLS trendline taken from the store."""
+    fig = px.scatter(df, x=x, y=y, **kwargs)
+    fig.add_trace(trend_trace(x, y, measure, color=fig.data[0].marker.color))
+    return fig